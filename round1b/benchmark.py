@@ -0,0 +1,188 @@
+# benchmark.py
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import main
+import subsummarizer
+from instrumentation import Timings
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def peak_rss():
+    """High-water resident set size of this process, in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+def current_rss():
+    """Resident set size of this process in bytes, including memory allocated by C code."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return peak_rss()
+
+class RssTimings(Timings):
+    """main's Timings, plus the peak resident memory each stage adds.
+
+    Unlike tracemalloc, RSS includes what MuPDF, XGBoost and BLAS allocate
+    themselves. A sampler thread reads it every `interval` seconds while the
+    timings are entered. A stage that raises the process's ru_maxrss
+    high-water mark is credited with that mark, so a spike inside a C call
+    that holds the GIL is not missed either. `peak_bytes` holds each stage's
+    peak above the RSS at its start.
+    """
+
+    __slots__ = ("peak_bytes", "interval", "_peak", "_stop", "_thread")
+
+    def __init__(self, interval=0.01):
+        super().__init__()
+        self.peak_bytes = {}
+        self.interval = interval
+        self._peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, current_rss())
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    @contextmanager
+    def stage(self, name):
+        start_rss, start_max = current_rss(), peak_rss()
+        outer, self._peak = self._peak, start_rss
+        try:
+            with super().stage(name):
+                yield
+        finally:
+            peak = max(self._peak, current_rss())
+            if peak_rss() > start_max:
+                peak = max(peak, peak_rss())
+            self.peak_bytes[name] = max(self.peak_bytes.get(name, 0), peak - start_rss)
+            self._peak = max(outer, peak)
+
+def run_collection(pdf_paths, persona, job, timings):
+    """Runs main.py's document analysis and case output over one collection, timing `timings`' stages."""
+    analyses = []
+    for pdf_path in pdf_paths:
+        outline, pages = main.analyze_document(pdf_path, timings=timings)
+        timings.count("pages", len(pages))
+        analyses.append((Path(pdf_path).name, outline, pages))
+    main.build_case_output(persona, job, analyses, timings)
+
+def replicate(pdf_paths, n_docs, out_dir):
+    """Fills `out_dir` with `n_docs` links to the given PDFs, cycling through them."""
+    out = []
+    for i in range(n_docs):
+        src = Path(pdf_paths[i % len(pdf_paths)]).resolve()
+        dst = Path(out_dir) / f"{i:05d}_{src.name}"
+        try:
+            dst.symlink_to(src)
+        except OSError:
+            dst.write_bytes(src.read_bytes())
+        out.append(dst)
+    return out
+
+def measure(name, pdf_paths, persona, job, memory=True):
+    """Times one collection through main's stage hooks; with `memory`, also records RSS per stage."""
+    main.load_models()
+    subsummarizer.load_model()
+    timings = RssTimings() if memory else Timings()
+    base_rss = current_rss()
+    if memory:
+        with timings:
+            run_collection(pdf_paths, persona, job, timings)
+    else:
+        run_collection(pdf_paths, persona, job, timings)
+
+    # Dotted stages (rules.form_check) are already part of their parent's time.
+    total = sum(sec for stage, sec in timings.seconds.items() if "." not in stage)
+    pages = timings.counters.get("pages", 0)
+    result = {
+        "collection": name,
+        "documents": len(pdf_paths),
+        "pages": pages,
+        "total_seconds": round(total, 4),
+        "pages_per_second": round(pages / total, 2) if total else None,
+        "documents_per_second": round(len(pdf_paths) / total, 2) if total else None,
+        "stages": {stage: {"seconds": round(sec, 4)} for stage, sec in timings.seconds.items()},
+        "counters": dict(timings.counters),
+    }
+    if memory:
+        for stage, peak in timings.peak_bytes.items():
+            result["stages"][stage]["peak_rss_growth_mb"] = round(peak / 2**20, 2)
+        result["models_rss_mb"] = round(base_rss / 2**20, 2)
+        result["peak_rss_mb"] = round(peak_rss() / 2**20, 2)
+    return result
+
+def measure_isolated(*args):
+    """Runs `measure` in a fresh worker process, so each collection's peak RSS is its own."""
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(measure, *args).result()
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stage-level benchmark of the ranking pipeline.")
+    parser.add_argument("--cases", default="challenge_case_00*",
+                        help="Glob of case directories under input/ (default challenge_case_00*).")
+    parser.add_argument("--scale", type=int, nargs="*", default=[100],
+                        help="Sizes of synthetic collections built by replicating the bundled PDFs.")
+    parser.add_argument("--out", default="benchmark_results.json", help="Where to write the JSON report.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the per-stage RSS sampling.")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    cases = sorted(main.INPUT_ROOT.glob(args.cases))
+    results = []
+    for case_dir in cases:
+        persona, job = main.read_case(case_dir)
+        results.append(measure_isolated(case_dir.name, sorted(case_dir.glob("*.pdf")), persona, job,
+                                        not args.no_memory))
+        print(f"{case_dir.name}: {results[-1]['total_seconds']}s")
+
+    all_pdfs = [p for case_dir in cases for p in sorted(case_dir.glob("*.pdf"))]
+    if all_pdfs and cases:
+        persona, job = main.read_case(cases[0])
+        for n_docs in args.scale:
+            with tempfile.TemporaryDirectory() as tmp:
+                pdf_paths = replicate(all_pdfs, n_docs, tmp)
+                results.append(measure_isolated(f"synthetic_{n_docs}", pdf_paths, persona, job, not args.no_memory))
+            print(f"synthetic_{n_docs}: {results[-1]['total_seconds']}s")
+
+    report = {
+        "generated_at": datetime.utcnow().isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "collections": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark written to {args.out}")
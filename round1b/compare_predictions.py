@@ -1,51 +1,101 @@
+import argparse
 import json
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import pandas as pd
 from difflib import SequenceMatcher
+from text_similarity import TextMatcher
 
 LABEL_DIR = Path("labels")
 PRED_DIR = Path("output")
 OUT_CSV = "pseudo_training.csv"
+THRESHOLD = 0.85
 
 def similarity(a: str, b: str) -> float:
     return SequenceMatcher(None, a.lower(), b.lower()).ratio()
 
-rows = []
+def load_predictions(pred_dir=PRED_DIR):
+    predictions = {}
+    for pred_file in sorted(Path(pred_dir).glob("challenge_case_*.json")):
+        with open(pred_file, "r", encoding="utf-8") as f:
+            predictions[pred_file.name] = json.load(f)
+    return predictions
 
-for label_file in sorted(LABEL_DIR.glob("challenge_case_*.json")):
-    pred_file = PRED_DIR / label_file.name
-    if not pred_file.exists():
-        print(f"⚠️ Missing prediction for: {label_file.name}")
-        continue
+def mine_case(label_file, pred, same_key=False, minhash_threshold=None):
+    """Pseudo-label rows for one case: predictions whose summary matches a label's.
 
+    By default a prediction is compared against every label summary in the
+    case and paired with the best one at or above THRESHOLD. With `same_key`,
+    it is only compared with the label for the same (document, page_number).
+    """
     with open(label_file, "r", encoding="utf-8") as f1:
         gt = json.load(f1)
-    with open(pred_file, "r", encoding="utf-8") as f2:
-        pred = json.load(f2)
 
-    gt_map = {
-        (item["document"], item["page_number"]): item["refined_text"]
-        for item in gt.get("subsection_analysis", [])
-    }
+    labels = [item for item in gt.get("subsection_analysis", []) if item.get("refined_text", "").strip()]
+    label_texts = [item["refined_text"].strip() for item in labels]
+    if same_key:
+        by_key = {(item["document"], item["page_number"]): text for item, text in zip(labels, label_texts)}
+    else:
+        matcher = TextMatcher(label_texts, THRESHOLD, minhash_threshold)
 
+    rows = []
     for item in pred.get("subsection_analysis", []):
-        key = (item["document"], item["page_number"])
         pred_text = item.get("refined_text", "").strip()
-        true_text = gt_map.get(key, "").strip()
+        if not pred_text:
+            continue
+
+        if same_key:
+            true_text = by_key.get((item["document"], item["page_number"]), "")
+            if not true_text or similarity(pred_text, true_text) < THRESHOLD:
+                continue
+        else:
+            match = matcher.best_match(pred_text)
+            if match is None:
+                continue
+            true_text = label_texts[match[0]]
+
+        rows.append({
+            "document": item["document"],
+            "section_title": item.get("section_title", ""),
+            "page": item["page_number"],
+            "paragraph": pred_text,           # used as "input"
+            "refined_text": true_text         # used as "target"
+        })
+    return rows
+
+def mine_pseudo_labels(predictions, label_dir=LABEL_DIR, workers=1, same_key=False, minhash_threshold=None):
+    """Keeps predicted summaries that are close enough to a ground-truth one.
 
-        if not pred_text or not true_text:
+    `predictions` maps an output file name (e.g. challenge_case_001.json) to its
+    output JSON, so it can come straight from main.run or from disk. With more
+    than one worker, label files are scored in parallel; rows keep label order.
+    """
+    jobs = []
+    for label_file in sorted(Path(label_dir).glob("challenge_case_*.json")):
+        pred = predictions.get(label_file.name)
+        if pred is None:
+            print(f"⚠️ Missing prediction for: {label_file.name}")
             continue
+        jobs.append((label_file, pred))
 
-        score = similarity(pred_text, true_text)
-        if score >= 0.85:
-            rows.append({
-                "document": item["document"],
-                "section_title": item.get("section_title", ""),
-                "page": item["page_number"],
-                "paragraph": pred_text,           # used as "input"
-                "refined_text": true_text         # used as "target"
-            })
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(mine_case, f, p, same_key, minhash_threshold) for f, p in jobs]
+            case_rows = [future.result() for future in futures]
+    else:
+        case_rows = [mine_case(f, p, same_key, minhash_threshold) for f, p in jobs]
 
+    return pd.DataFrame([row for rows in case_rows for row in rows])
 
-pd.DataFrame(rows).to_csv(OUT_CSV, index=False)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mine pseudo-labels from predictions that match ground-truth summaries.")
+    parser.add_argument("--workers", type=int, default=1, help="Processes scoring label files in parallel.")
+    parser.add_argument("--same-key", action="store_true",
+                        help="Only compare a prediction with the label for the same (document, page).")
+    parser.add_argument("--minhash", type=float, default=None, metavar="JACCARD",
+                        help="Also skip candidates below this estimated shingle Jaccard (approximate).")
+    args = parser.parse_args()
 
+    predictions = load_predictions()
+    mine_pseudo_labels(predictions, workers=args.workers, same_key=args.same_key,
+                       minhash_threshold=args.minhash).to_csv(OUT_CSV, index=False)
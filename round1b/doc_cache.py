@@ -0,0 +1,359 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+# Bump when the layout, rules or entry format change so old entries stop matching.
+CACHE_FORMAT = 2
+
+MODEL_FILES = [
+    "heading_classifier.joblib",
+    "label_encoder.joblib",
+    "font_encoder.joblib",
+    "punctuation_encoder.joblib",
+]
+
+_model_versions = {}
+_directories = {}
+_directories_lock = threading.Lock()
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 of a file's content."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+def model_version(model_dir="model", files=MODEL_FILES):
+    """Hash of the model `files` in `model_dir`; changes whenever they are retrained.
+
+    Missing files hash as absent, so an optional file (a summarizer index) can
+    be listed too.
+    """
+    model_dir = Path(model_dir)
+    files = tuple(files)
+    stamp = tuple((name, _file_stamp(model_dir / name)) for name in files)
+    cached = _model_versions.get((model_dir, files))
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    h = hashlib.sha256(f"format={CACHE_FORMAT}".encode())
+    for name, file_stamp in stamp:
+        h.update(name.encode())
+        h.update(file_digest(model_dir / name).encode() if file_stamp is not None else b"-")
+    version = h.hexdigest()
+    _model_versions[(model_dir, files)] = (stamp, version)
+    return version
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+class CacheDirectory:
+    """In-memory LRU index of the `*.json` entry files in one cache directory.
+
+    The directory is scanned once per process, on first use. After that, puts,
+    hits and removals update {file name: (size, mtime)}, kept oldest first,
+    so eviction never stats every entry again. Other processes writing to the
+    same directory (pool workers, concurrent runs) change its mtime, which
+    this process's own writes account for; `sync` then lists the names to
+    pick up or drop their entries. All cache objects over the same root share
+    one index: pool tasks each unpickle their own copy of a cache, but not of this.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.lock = threading.RLock()
+        self.entries = OrderedDict()
+        self.total = 0
+        self.mtime = _mtime(self.root)
+        self._add(path.name for path in self.root.glob("*.json"))
+
+    @classmethod
+    def of(cls, root):
+        """The process's shared index of `root`, scanning it the first time."""
+        key = os.path.abspath(root)
+        with _directories_lock:
+            directory = _directories.get(key)
+            if directory is None:
+                directory = _directories[key] = cls(root)
+            return directory
+
+    def _add(self, names):
+        found = []
+        for name in names:
+            try:
+                st = os.stat(self.root / name)
+            except OSError:
+                continue
+            found.append((st.st_mtime, name, st.st_size))
+        for mtime, name, size in sorted(found):
+            self.entries[name] = (size, mtime)
+            self.total += size
+
+    def _own(self, change, *args):
+        # Keeps the directory mtime this process's own change causes from looking like another process's.
+        before = _mtime(self.root)
+        change(*args)
+        if before == self.mtime:
+            self.mtime = _mtime(self.root)
+
+    def sync(self):
+        """Picks up entries other processes added or removed since the directory was last seen."""
+        with self.lock:
+            mtime = _mtime(self.root)
+            if mtime == self.mtime:
+                return
+            names = {entry.name for entry in os.scandir(self.root) if entry.name.endswith(".json")}
+            for name in [name for name in self.entries if name not in names]:
+                self.total -= self.entries.pop(name)[0]
+            self._add(names.difference(self.entries))
+            self.mtime = mtime
+
+    def write(self, name, obj):
+        """Writes an entry file atomically and records it as just used.
+
+        The temp file is unique to this write and lives under `tmp/`, so
+        concurrent writers never share one and the root only changes on rename.
+        """
+        tmp_dir = self.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=tmp_dir, suffix=".json")
+        try:
+            with open(fd, "w", encoding="utf-8") as f:
+                json.dump(obj, f)
+                f.flush()
+                size = os.fstat(f.fileno()).st_size
+            with self.lock:
+                self._own(os.replace, tmp, self.root / name)
+                self.touch(name, size)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def touch(self, name, size, mtime=None):
+        """Records an entry as just written or used."""
+        with self.lock:
+            old = self.entries.pop(name, None)
+            if old is not None:
+                self.total -= old[0]
+            self.entries[name] = (size, time.time() if mtime is None else mtime)
+            self.total += size
+
+    def remove(self, name):
+        """Deletes an entry file and forgets it."""
+        with self.lock:
+            old = self.entries.pop(name, None)
+            if old is not None:
+                self.total -= old[0]
+            try:
+                self._own((self.root / name).unlink)
+            except OSError:
+                pass
+
+class OutlineCache:
+    """Persistent, size-bounded cache of per-document outlines and page text.
+
+    Entries are JSON files named after the PDF content hash combined with the
+    model version, so retraining the heading models or editing a PDF never
+    serves a stale outline. When the directory grows past `max_bytes`, the least
+    recently used entries (by mtime, refreshed on every hit) are removed; see
+    CacheDirectory for how that avoids rescanning the directory.
+    """
+
+    def __init__(self, root, max_bytes=512 * 1024 * 1024, model_dir="model"):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.model_dir = Path(model_dir)
+        self.version = None
+
+    def models(self):
+        """Version of the heading models, as pinned by pin_models or else as on disk."""
+        return self.version if self.version is not None else model_version(self.model_dir)
+
+    def pin_models(self):
+        """Keys every later entry on the models as they are now; for a process that loaded them once."""
+        self.version = None
+        self.version = self.models()
+        return self.version
+
+    def key(self, pdf_path, data=None):
+        """Cache key of a PDF; pass `data` if its content is already in memory."""
+        digest = hashlib.sha256(data).hexdigest() if data is not None else file_digest(pdf_path)
+        return hashlib.sha256(f"{digest}:{self.models()}".encode()).hexdigest()
+
+    def _path(self, key):
+        return self.root / f"{key}.json"
+
+    def get(self, key):
+        """Returns {"outline": [...], "pages": [...]} for a key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+                size = os.fstat(f.fileno()).st_size
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        CacheDirectory.of(self.root).touch(path.name, size)
+        return entry
+
+    def put(self, key, outline, pages):
+        self.root.mkdir(parents=True, exist_ok=True)
+        CacheDirectory.of(self.root).write(self._path(key).name, {"outline": outline, "pages": pages})
+        self.evict()
+
+    def evict(self):
+        """Drops least recently used entries until the cache fits in `max_bytes`."""
+        directory = CacheDirectory.of(self.root)
+        with directory.lock:
+            directory.sync()
+            while directory.total > self.max_bytes and directory.entries:
+                directory.remove(next(iter(directory.entries)))
+
+def _squash(text):
+    return " ".join(str(text).split()).lower()
+
+class QueryCache:
+    """Persistent cache of whole query results, keyed by what the output depends on.
+
+    The key covers the persona and job text (case and whitespace folded), the
+    document names with their content hashes in input order, and the version
+    of the heading models and of the summarizer files. Entry files are named
+    `<models>-<key>.json`, so retraining either model turns every older entry
+    stale, and the next eviction deletes them. Beyond that, entries unused
+    for `ttl_seconds` expire, and past `max_entries` the least recently used
+    go (by mtime, refreshed on every hit), tracked in memory by
+    CacheDirectory. `hits`, `misses` and `evictions`
+    count this process's lookups. A cache can be shared by server threads;
+    the counters and the PDF digest memo (the `max_digests` most recently
+    used files) are updated under `lock`.
+    """
+
+    def __init__(self, root, max_entries=1000, ttl_seconds=7 * 24 * 3600, model_dir="model", summarizer_files=(),
+                 max_digests=4096):
+        self.root = Path(root)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.model_dir = Path(model_dir)
+        self.summarizer_files = [Path(p) for p in summarizer_files]
+        self.max_digests = max_digests
+        self.digests = OrderedDict()
+        self.lock = threading.Lock()
+        self.purged_models = None
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def models(self):
+        """Version of every model the output depends on, as pinned by pin_models or else as on disk."""
+        if self.version is not None:
+            return self.version
+        h = hashlib.sha256(model_version(self.model_dir).encode())
+        for path in self.summarizer_files:
+            h.update(model_version(path.parent, [path.name]).encode())
+        return h.hexdigest()[:16]
+
+    def pin_models(self):
+        """Keys every later entry on the models as they are now; for a process that loaded them once."""
+        self.version = None
+        self.version = self.models()
+        return self.version
+
+    def _digest(self, path):
+        # Content hashes are reused while a file's size and mtime stay the same.
+        st = os.stat(path)
+        stamp = (str(path), st.st_size, st.st_mtime_ns)
+        with self.lock:
+            digest = self.digests.get(stamp)
+            if digest is not None:
+                self.digests.move_to_end(stamp)
+                return digest
+        digest = file_digest(path)
+        with self.lock:
+            self.digests[stamp] = digest
+            while len(self.digests) > self.max_digests:
+                self.digests.popitem(last=False)
+        return digest
+
+    def key(self, persona, job, pdf_paths):
+        documents = [[Path(p).name, self._digest(p)] for p in pdf_paths]
+        query = json.dumps([_squash(persona), _squash(job), documents])
+        return f"{self.models()}-{hashlib.sha256(query.encode()).hexdigest()}"
+
+    def _path(self, key):
+        return self.root / f"{key}.json"
+
+    def get(self, key):
+        """Returns the cached output JSON for a key, or None on a miss or an expired entry."""
+        path = self._path(key)
+        directory = CacheDirectory.of(self.root)
+        expired = False
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl_seconds:
+                directory.remove(path.name)
+                expired = True
+                raise OSError("expired")
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+                size = os.fstat(f.fileno()).st_size
+            os.utime(path)
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+                self.evictions += expired
+            return None
+        directory.touch(path.name, size)
+        with self.lock:
+            self.hits += 1
+        return entry
+
+    def put(self, key, output):
+        self.root.mkdir(parents=True, exist_ok=True)
+        CacheDirectory.of(self.root).write(self._path(key).name, output)
+        self.evict()
+
+    def evict(self):
+        """Drops entries of older models, expired entries, then the least recently used past `max_entries`."""
+        models = self.models()
+        directory = CacheDirectory.of(self.root)
+        removed = 0
+        with directory.lock:
+            directory.sync()
+            if models != self.purged_models:
+                # Only on the first eviction and after a model change: every other version goes.
+                for name in [name for name in directory.entries if not name.startswith(models + "-")]:
+                    directory.remove(name)
+                    removed += 1
+                self.purged_models = models
+            cutoff = time.time() - self.ttl_seconds
+            while directory.entries:
+                name, (_, mtime) = next(iter(directory.entries.items()))
+                if mtime >= cutoff and len(directory.entries) <= self.max_entries:
+                    break
+                directory.remove(name)
+                removed += 1
+        with self.lock:
+            self.evictions += removed
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
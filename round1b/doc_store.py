@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from itertools import islice
+from pathlib import Path
+
+import fitz
+
+def iter_text_lines(text):
+    """Yields the stripped, non-empty lines of a page text, scanning lazily.
+
+    Callers that only need the first N lines stop the scan after N lines instead
+    of splitting and stripping the whole page.
+    """
+    start = 0
+    length = len(text)
+    while start < length:
+        end = text.find("\n", start)
+        if end == -1:
+            end = length
+        line = text[start:end].strip()
+        if line:
+            yield line
+        start = end + 1
+
+class DocumentStore:
+    """Keeps one PyMuPDF handle per PDF open for a whole run and memoizes page text.
+
+    Handles are kept in LRU order and closed past `max_open`. Page text is
+    decoded once per (document, page) and served from memory afterwards.
+    """
+
+    def __init__(self, max_open=64):
+        self.max_open = max_open
+        self.handles = OrderedDict()
+        self.texts = {}
+
+    def open(self, pdf_path):
+        key = str(Path(pdf_path))
+        doc = self.handles.get(key)
+        if doc is None:
+            doc = fitz.open(pdf_path)
+            self.handles[key] = doc
+            while len(self.handles) > self.max_open:
+                _, old = self.handles.popitem(last=False)
+                old.close()
+        else:
+            self.handles.move_to_end(key)
+        return doc
+
+    def page_text(self, pdf_path, page_number):
+        key = (str(Path(pdf_path)), page_number)
+        text = self.texts.get(key)
+        if text is None:
+            text = self.texts[key] = self.open(pdf_path)[page_number].get_text("text")
+        return text
+
+    def first_lines(self, pdf_path, page_number, max_lines):
+        """The first `max_lines` non-empty lines of a page, stopping the scan there."""
+        return list(islice(iter_text_lines(self.page_text(pdf_path, page_number)), max_lines))
+
+    def close(self):
+        for doc in self.handles.values():
+            doc.close()
+        self.handles.clear()
+        self.texts.clear()
@@ -1,42 +1,41 @@
-import fitz
 import re
 from collections import Counter
+from instrumentation import NULL_TIMINGS
+from layout import page_text
+from records import OutlineEntry
 
 def normalize(text):
     return re.sub(r"\s+", " ", text.strip()).lower()
 
 def extract_title(page):
-    """Extract a plausible title from the first page using font size and position."""
-    blocks = page.get_text("dict")["blocks"]
+    """Extract a plausible title from a page layout using font size and position."""
     max_font = 0
     candidates = []
-    height = page.rect.height
-
-    for block in blocks:
-        for line in block.get("lines", []):
-            for span in line.get("spans", []):
-                text = span["text"].strip()
-                if not text or len(text) < 3:
-                    continue
-                if re.match(r"^(Copyright|Page|May|©|www\.|file:|http)", text, re.I):
-                    continue
-                if "qualification" in text.lower() or "board" in text.lower():
-                    continue
-                if span["size"] > max_font:
-                    max_font = span["size"]
-
-    for block in blocks:
-        for line in block.get("lines", []):
-            for span in line.get("spans", []):
-                text = span["text"].strip()
-                if not text or len(text) < 3:
-                    continue
-                if re.match(r"^(Copyright|Page|May|©|www\.|file:|http)", text, re.I):
-                    continue
-                if "qualification" in text.lower() or "board" in text.lower():
-                    continue
-                if span["size"] >= max_font - 1 and span["bbox"][1] < height * 0.35 and span["bbox"][0] < 300:
-                    candidates.append(text)
+    height = page.height
+    sizes = page.sizes.tolist()
+    bboxes = page.bboxes.tolist()
+
+    for span_text, size in zip(page.texts, sizes):
+        text = span_text.strip()
+        if not text or len(text) < 3:
+            continue
+        if re.match(r"^(Copyright|Page|May|©|www\.|file:|http)", text, re.I):
+            continue
+        if "qualification" in text.lower() or "board" in text.lower():
+            continue
+        if size > max_font:
+            max_font = size
+
+    for span_text, size, bbox in zip(page.texts, sizes, bboxes):
+        text = span_text.strip()
+        if not text or len(text) < 3:
+            continue
+        if re.match(r"^(Copyright|Page|May|©|www\.|file:|http)", text, re.I):
+            continue
+        if "qualification" in text.lower() or "board" in text.lower():
+            continue
+        if size >= max_font - 1 and bbox[1] < height * 0.35 and bbox[0] < 300:
+            candidates.append(text)
 
     seen = set()
     ordered = []
@@ -49,98 +48,115 @@ def extract_title(page):
 
 def looks_like_form(page):
     """Detects if a PDF page looks like a government form."""
-    text = page.get_text("text").lower()
+    text = page_text(page).lower()
     keywords = ["application", "form", "signature", "undertake", "date of",
                 "name of", "designation", "service", "pay", "whether"]
     count = sum(1 for kw in keywords if kw in text)
     colon_lines = sum(1 for line in text.splitlines() if ":" in line)
     return count >= 3 or colon_lines > 10
 
-def extract_headings_structured(doc):
-    """Returns a list of headings by using regex rules and font size matching."""
+def form_headings(page):
+    """Headings of a form-like first page (its label lines), or None if the page is no form."""
+    if not looks_like_form(page):
+        return None
     outline = []
     seen = set()
+    text = page_text(page)
+    for line in text.splitlines():
+        line = line.strip()
+        if ":" in line and len(line) < 100 and not re.search(r"\d", line):
+            if line not in seen:
+                outline.append(OutlineEntry("H1", line.rstrip(":").strip(), 0))
+                seen.add(line)
+    return outline
+
+def rule_level(clean, x0, font_size, h1_font_size):
+    """Heading level the regex/font rules give a line, or None."""
+    # --- H1 Rule ---
+    if (re.match(r"^\d+\.\s+\S+", clean)
+            and len(clean.split()) < 10
+            and x0 < 100
+            and (h1_font_size is None or abs(font_size - h1_font_size) < 1.0)
+            and len(clean) < 60):
+        return "H1"
+
+    # --- H1 Big Font No-Number ---
+    if (h1_font_size is not None
+            and abs(font_size - h1_font_size) < 1.0
+            and x0 < 100 and 7 < len(clean) < 50
+            and not re.match(r"^\d+(\.|,)", clean)):
+        return "H1"
+
+    # --- H2 Rule ---
+    if re.match(r"^\d+\.\d+\s+\S+", clean):
+        return "H2"
+
+    # --- H3 Rule ---
+    if re.match(r"^\d+\.\d+\.\d+\s+\S+", clean):
+        return "H3"
+    return None
+
+def rule_candidates(layout, first_page=0):
+    """One pass over the lines of a page range, for `resolve_rule_headings`.
+
+    Returns the font sizes of numbered headings (the samples of the H1 size
+    estimate) and (text, page, font size, x0) of every line that some H1 size
+    would make a heading. Neither depends on other pages, so page ranges can
+    be scanned separately and their lists concatenated in page order.
+    """
     h1_font_sizes = []
-
-    if looks_like_form(doc[0]):
-        text = doc[0].get_text("text")
-        for line in text.splitlines():
-            line = line.strip()
-            if ":" in line and len(line) < 100 and not re.search(r"\d", line):
-                if line not in seen:
-                    outline.append({
-                        "level": "H1",
-                        "text": line.rstrip(":").strip(),
-                        "page": 0
-                    })
-                    seen.add(line)
-        return outline
-
-    # Step 1: Estimate H1 font size from common numbered headings
-    for page in doc:
-        for block in page.get_text("dict")["blocks"]:
-            for line in block.get("lines", []):
-                spans = line.get("spans", [])
-                if not spans:
-                    continue
-                text = "".join(span["text"] for span in spans).strip()
-                if re.match(r"^\d+\.\s+\S+", text) and len(text.split()) < 10:
-                    h1_font_sizes.append(spans[0]["size"])
-
+    candidates = []
+    for i, page in enumerate(layout, first_page):
+        sizes = page.sizes.tolist()
+        x0s = page.bboxes[:, 0].tolist()
+        for start, end in page.line_ranges():
+            if start == end:
+                continue
+            text = page.line_text(start, end).strip()
+            if not text:
+                continue
+            font_size = sizes[start]
+            if re.match(r"^\d+\.\s+\S+", text) and len(text.split()) < 10:
+                h1_font_sizes.append(font_size)
+            # Any H1 size rules a line in only if one of these two does.
+            if rule_level(text, x0s[start], font_size, None) or rule_level(text, x0s[start], font_size, font_size):
+                candidates.append((text, i, font_size, x0s[start]))
+    return h1_font_sizes, candidates
+
+def resolve_rule_headings(h1_font_sizes, candidates):
+    """Applies the rules to a whole document's candidates, given all its H1 size samples.
+
+    The H1 size is the most common sample (the first one seen wins a tie), and
+    a text that already became a heading is not considered again on later pages.
+    """
     h1_font_size = Counter(h1_font_sizes).most_common(1)[0][0] if h1_font_sizes else None
-
-    for i, page in enumerate(doc):
-        for block in page.get_text("dict")["blocks"]:
-            for line in block.get("lines", []):
-                spans = line.get("spans", [])
-                if not spans:
-                    continue
-                text = "".join(span["text"] for span in spans).strip()
-                if not text or text in seen:
-                    continue
-
-                x0 = spans[0]["bbox"][0]
-                font_size = spans[0]["size"]
-                clean = text
-
-                # --- H1 Rule ---
-                if (re.match(r"^\d+\.\s+\S+", clean)
-                        and len(clean.split()) < 10
-                        and x0 < 100
-                        and (h1_font_size is None or abs(font_size - h1_font_size) < 1.0)
-                        and len(clean) < 60):
-                    outline.append({"level": "H1", "text": clean, "page": i})
-                    seen.add(clean)
-                    continue
-
-                # --- H1 Big Font No-Number ---
-                if (h1_font_size is not None
-                        and abs(font_size - h1_font_size) < 1.0
-                        and x0 < 100 and 7 < len(clean) < 50
-                        and clean not in seen
-                        and not re.match(r"^\d+(\.|,)", clean)):
-                    outline.append({"level": "H1", "text": clean, "page": i})
-                    seen.add(clean)
-                    continue
-
-                # --- H2 Rule ---
-                if re.match(r"^\d+\.\d+\s+\S+", clean):
-                    outline.append({"level": "H2", "text": clean, "page": i})
-                    seen.add(clean)
-                    continue
-
-                # --- H3 Rule ---
-                if re.match(r"^\d+\.\d+\.\d+\s+\S+", clean):
-                    outline.append({"level": "H3", "text": clean, "page": i})
-                    seen.add(clean)
-                    continue
+    outline = []
+    seen = set()
+    for text, page, font_size, x0 in candidates:
+        if text in seen:
+            continue
+        level = rule_level(text, x0, font_size, h1_font_size)
+        if level is not None:
+            outline.append(OutlineEntry(level, text, page))
+            seen.add(text)
 
     # Deduplicate
     final_outline = []
     seen_keys = set()
     for item in outline:
-        key = (item["text"], item["page"], item["level"])
+        key = (item.text, item.page, item.level)
         if key not in seen_keys:
             final_outline.append(item)
             seen_keys.add(key)
     return final_outline
+
+def extract_headings_structured(layout, timings=NULL_TIMINGS):
+    """Returns a list of headings by using regex rules and font size matching on a page layout."""
+    with timings.stage("rules.form_check"):
+        outline = form_headings(layout[0])
+    if outline is not None:
+        return outline
+    with timings.stage("rules.lines"):
+        h1_font_sizes, candidates = rule_candidates(layout)
+    with timings.stage("rules.resolve"):
+        return resolve_rule_headings(h1_font_sizes, candidates)
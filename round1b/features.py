@@ -0,0 +1,110 @@
+import re
+import numpy as np
+
+features_cols = [
+    "font_size", "font_name_encoded", "is_bold", "is_italic",
+    "x0", "x1", "y0", "y1",
+    "char_count", "capital_ratio", "line_y_ratio",
+    "punctuation_encoded", "has_numbering"
+]
+
+NUMBERING_RE = re.compile(r"^\d+(\.\d+)*")
+
+def encoder_lookup(encoder):
+    """Maps each class of a fitted LabelEncoder to its code, like `encoder.transform` does."""
+    return class_lookup(encoder.classes_)
+
+def class_lookup(classes):
+    """Maps each of a LabelEncoder's sorted classes to its code."""
+    return {label: code for code, label in enumerate(classes)}
+
+def _gather(starts, ends):
+    """Row indices covering the [start, end) ranges, concatenated in order."""
+    counts = ends - starts
+    offsets = np.repeat(starts - np.concatenate(([0], np.cumsum(counts)[:-1])), counts)
+    return np.arange(counts.sum()) + offsets, counts
+
+def build_features(layout, font_lookup, punct_lookup, prefilter=None, first_page=0):
+    """Builds the classifier matrix for every text line of a document in one batch.
+
+    Span sizes and boxes are gathered straight from each page's columnar arrays
+    and reduced per line, and fonts/punctuation are encoded through precomputed
+    dicts instead of one LabelEncoder.transform call per line. Returns a
+    contiguous float32 matrix in `features_cols` order, plus the text and page
+    number of each row. With a `prefilter` (see prefilter.LinePrefilter), lines
+    it rules out get no row at all. Pages are numbered from `first_page`.
+    """
+    line_texts, line_pages = [], []
+    sizes, bboxes, span_counts, page_heights = [], [], [], []
+    first_fonts, bold, italic = [], [], []
+    char_counts, capital_ratios, puncts, numbering = [], [], [], []
+    font_flags = {}
+
+    for page_num, page in enumerate(layout, first_page):
+        fonts = page.fonts
+        starts, ends = [], []
+        if prefilter is not None:
+            first_sizes = page.sizes.tolist()
+            first_y = page.bboxes[:, 1].tolist()
+            height = page.height or 1.0
+
+        for start, end in page.line_ranges():
+            if start == end:
+                continue
+            text = page.line_text(start, end, " ").strip()
+            if not text:
+                continue
+
+            is_bold = is_italic = False
+            for font in fonts[start:end]:
+                flags = font_flags.get(font)
+                if flags is None:
+                    flags = font_flags[font] = ("Bold" in font, "Italic" in font)
+                is_bold = is_bold or flags[0]
+                is_italic = is_italic or flags[1]
+            if prefilter is not None and not prefilter.keep(text, first_sizes[start], is_bold, first_y[start] / height):
+                continue
+
+            starts.append(start)
+            ends.append(end)
+            first_fonts.append(font_lookup.get(fonts[start], 0))
+            bold.append(is_bold)
+            italic.append(is_italic)
+            char_counts.append(len(text))
+            capital_ratios.append(sum(1 for c in text if c.isupper()) / max(len(text), 1))
+            puncts.append(punct_lookup.get(text[-1] if text[-1] in ":.?" else "none", 0))
+            numbering.append(NUMBERING_RE.match(text) is not None)
+            line_texts.append(text)
+            line_pages.append(page_num)
+
+        if starts:
+            rows, counts = _gather(np.asarray(starts), np.asarray(ends))
+            sizes.append(page.sizes[rows])
+            bboxes.append(page.bboxes[rows])
+            span_counts.append(counts)
+            page_heights.append(np.full(len(starts), page.height, dtype=np.float64))
+
+    X = np.empty((len(line_texts), len(features_cols)), dtype=np.float32)
+    if not line_texts:
+        return X, line_texts, line_pages
+
+    counts = np.concatenate(span_counts)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    sizes = np.concatenate(sizes)
+    bboxes = np.concatenate(bboxes)
+    y0 = np.minimum.reduceat(bboxes[:, 1], starts)
+
+    X[:, 0] = np.add.reduceat(sizes, starts) / counts
+    X[:, 1] = first_fonts
+    X[:, 2] = bold
+    X[:, 3] = italic
+    X[:, 4] = np.minimum.reduceat(bboxes[:, 0], starts)
+    X[:, 5] = np.maximum.reduceat(bboxes[:, 2], starts)
+    X[:, 6] = y0
+    X[:, 7] = np.maximum.reduceat(bboxes[:, 3], starts)
+    X[:, 8] = char_counts
+    X[:, 9] = capital_ratios
+    X[:, 10] = y0 / np.concatenate(page_heights)
+    X[:, 11] = puncts
+    X[:, 12] = numbering
+    return X, line_texts, line_pages
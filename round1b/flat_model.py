@@ -0,0 +1,495 @@
+# flat_model.py
+
+import argparse
+import json
+import os
+import re
+import shutil
+from pathlib import Path
+
+import numpy as np
+from scipy.sparse import csr_matrix, hstack
+from doc_cache import MODEL_FILES, file_digest
+from summary_index import SummaryIndex, index_path, normalize_rows
+
+# Bump when the on-disk layout changes; loaders refuse other versions.
+FLAT_FORMAT = 3
+# Rows the tree evaluator scores at once; keeps its (nodes x rows) work arrays in cache.
+TREE_CHUNK_ROWS = 128
+
+_WHITE_SPACES = re.compile(r"\s\s+")
+
+# Vectorizer parameters that cannot be written as JSON; they must be left at their defaults.
+_CALLABLE_PARAMS = ("tokenizer", "preprocessor", "vocabulary", "dtype")
+
+def flat_path(model_path):
+    """Where the flat export of a summarizer model lives: `<stem>.flat/` next to it."""
+    model_path = str(model_path)
+    stem = model_path[:-len(".joblib")] if model_path.endswith(".joblib") else model_path
+    return Path(stem + ".flat")
+
+def _source_digests(*sources):
+    """{file name: content digest} of the existing source files, as an export's meta.json records them."""
+    return {Path(src).name: file_digest(src) for src in sources if os.path.exists(src)}
+
+def is_current(flat_dir, *sources):
+    """True if `flat_dir` holds an export in this format, made from source files with their current content.
+
+    Content digests rather than mtimes, so deploying files with their original
+    mtimes kept can neither hide a stale export nor discard a fresh one.
+    """
+    try:
+        with open(Path(flat_dir) / "meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return meta.get("format") == FLAT_FORMAT and meta.get("sources") == _source_digests(*sources)
+
+def _load(flat_dir, name):
+    return np.load(Path(flat_dir) / f"{name}.npy", mmap_mode="r")
+
+def _save_csr(out, name, matrix):
+    matrix = matrix.tocsr()
+    np.save(out / f"{name}.data.npy", matrix.data)
+    np.save(out / f"{name}.indices.npy", matrix.indices)
+    np.save(out / f"{name}.indptr.npy", matrix.indptr)
+    return list(matrix.shape)
+
+def _load_csr(flat_dir, name, shape):
+    return csr_matrix(
+        (_load(flat_dir, f"{name}.data"), _load(flat_dir, f"{name}.indices"), _load(flat_dir, f"{name}.indptr")),
+        shape=tuple(shape), copy=False,
+    )
+
+def _save_strings(out, name, strings):
+    blobs = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in blobs], out=offsets[1:])
+    with open(out / f"{name}.bin", "wb") as f:
+        f.write(b"".join(blobs))
+    np.save(out / f"{name}.offsets.npy", offsets)
+
+class StringTable:
+    """Read-only list of strings backed by a memory-mapped UTF-8 blob and offsets."""
+
+    def __init__(self, flat_dir, name):
+        self.offsets = _load(flat_dir, f"{name}.offsets")
+        size = int(self.offsets[-1])
+        self.blob = np.memmap(Path(flat_dir) / f"{name}.bin", dtype=np.uint8, mode="r") if size else np.zeros(0, np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[int(self.offsets[i]):int(self.offsets[i + 1])].tobytes().decode("utf-8")
+
+class FlatTfidfVectorizer:
+    """TfidfVectorizer.transform over a memory-mapped vocabulary and idf vector.
+
+    Terms are kept as one sorted fixed-width array and looked up with a binary
+    search, so loading never builds the vocabulary dict. Fixed-width strings
+    lose trailing NULs, so terms ending in one live in the small `nul_terms`
+    dict instead, and tokens ending in one are only looked up there. The
+    analyzer is rebuilt from the saved parameters and the weighting follows
+    sklearn step for step, so the output equals the original vectorizer's.
+    """
+
+    def __init__(self, params, terms, columns, idf, nul_terms=None):
+        self.params = params
+        self.analyzer = build_analyzer(params)
+        self.terms = terms
+        self.columns = columns
+        self.idf = idf
+        self.nul_terms = nul_terms or {}
+        self.width = terms.dtype.itemsize // np.dtype("<U1").itemsize
+
+    def transform(self, docs):
+        indices, indptr = [], [0]
+        for doc in docs:
+            tokens = self.analyzer(doc)
+            nul_columns = []
+            if any(t.endswith("\x00") for t in tokens):
+                nul_columns = [self.nul_terms[t] for t in tokens if t in self.nul_terms]
+                tokens = [t for t in tokens if not t.endswith("\x00")]
+            # Longer tokens cannot be terms, and would be truncated to a false match.
+            tokens = np.asarray([t for t in tokens if len(t) <= self.width], dtype=self.terms.dtype)
+            pos = np.searchsorted(self.terms, tokens)
+            pos[pos == len(self.terms)] = 0
+            hit = pos[self.terms[pos] == tokens] if len(self.terms) else pos[:0]
+            columns = np.asarray(self.columns[hit], dtype=np.int64)
+            if nul_columns:
+                columns = np.concatenate([columns, np.asarray(nul_columns, dtype=np.int64)])
+            indices.append(columns)
+            indptr.append(indptr[-1] + len(columns))
+        n_features = len(self.idf)
+        data = np.ones(indptr[-1], dtype=np.float64)
+        X = csr_matrix((data, np.concatenate(indices) if indices else [], indptr), shape=(len(docs), n_features))
+        X.sum_duplicates()
+        if self.params.get("binary"):
+            X.data.fill(1)
+        if self.params.get("sublinear_tf"):
+            np.log(X.data, X.data)
+            X.data += 1
+        if self.params.get("use_idf", True):
+            X = X @ _diag(self.idf)
+        if self.params.get("norm"):
+            X = normalize_rows(X, norm=self.params["norm"])
+        return X
+
+def _word_ngrams(tokens, min_n, max_n):
+    if max_n == 1:
+        return tokens
+    ngrams = list(tokens) if min_n == 1 else []
+    for n in range(max(min_n, 2), min(max_n + 1, len(tokens) + 1)):
+        ngrams.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+    return ngrams
+
+def _char_ngrams(text, min_n, max_n):
+    text = _WHITE_SPACES.sub(" ", text)
+    ngrams = list(text) if min_n == 1 else []
+    for n in range(max(min_n, 2), min(max_n + 1, len(text) + 1)):
+        ngrams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+    return ngrams
+
+def _char_wb_ngrams(text, min_n, max_n):
+    ngrams = []
+    for word in _WHITE_SPACES.sub(" ", text).split():
+        word = " " + word + " "
+        for n in range(min_n, max_n + 1):
+            ngrams.extend(word[i:i + n] for i in range(max(len(word) - n + 1, 1)))
+            if len(word) <= n:
+                # A word shorter than n yields itself once, not once per n.
+                break
+    return ngrams
+
+def build_analyzer(params):
+    """The text analyzer of a vectorizer with these parameters, without importing sklearn.
+
+    Covers the word, char and char_wb analyzers with lowercasing and n-grams,
+    token for token like sklearn's. Stop words and accent stripping fall back
+    to sklearn's own analyzer.
+    """
+    if params.get("stop_words") is not None or params.get("strip_accents") or params.get("input", "content") != "content":
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        return TfidfVectorizer(**params).build_analyzer()
+
+    lowercase = params.get("lowercase", True)
+    min_n, max_n = params.get("ngram_range", (1, 1))
+    analyzer = params.get("analyzer", "word")
+    if analyzer == "word":
+        tokenize = re.compile(params.get("token_pattern", r"(?u)\b\w\w+\b")).findall
+        ngrams = lambda text: _word_ngrams(tokenize(text), min_n, max_n)
+    elif analyzer == "char":
+        ngrams = lambda text: _char_ngrams(text, min_n, max_n)
+    elif analyzer == "char_wb":
+        ngrams = lambda text: _char_wb_ngrams(text, min_n, max_n)
+    else:
+        raise ValueError(f"unsupported analyzer {analyzer!r}")
+
+    def analyze(doc):
+        if isinstance(doc, bytes):
+            doc = doc.decode(params.get("encoding", "utf-8"), params.get("decode_error", "strict"))
+        return ngrams(doc.lower() if lowercase else doc)
+    return analyze
+
+def _diag(values):
+    n = len(values)
+    return csr_matrix((np.asarray(values, dtype=np.float64), np.arange(n), np.arange(n + 1)), shape=(n, n))
+
+def _vectorizer_params(vectorizer):
+    params = vectorizer.get_params()
+    for name in _CALLABLE_PARAMS:
+        value = params.pop(name, None)
+        if name != "dtype" and value is not None:
+            raise ValueError(f"cannot export a vectorizer with a custom {name}")
+    if callable(params.get("analyzer")):
+        raise ValueError("cannot export a vectorizer with a custom analyzer")
+    if "ngram_range" in params:
+        params["ngram_range"] = list(params["ngram_range"])
+    return params
+
+def save_summarizer(model, model_path, index=None):
+    """Writes a summarizer model dict (and its SummaryIndex) as flat arrays.
+
+    The CSR matrix, the vocabulary with its idf weights, the summary strings
+    and the index postings each become plain .npy/.bin files that
+    `load_summarizer` memory-maps. Returns the export directory.
+    """
+    out = flat_path(model_path)
+    tmp = out.with_name(out.name + f".{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    vectorizer = model["vectorizer"]
+    meta = {"format": FLAT_FORMAT, "sources": _source_digests(model_path, index_path(model_path)),
+            "params": _vectorizer_params(vectorizer)}
+    if isinstance(vectorizer, HashingVectorizer):
+        meta["vectorizer"] = "hashing"
+    else:
+        meta["vectorizer"] = "tfidf"
+        vocab = vectorizer.vocabulary_
+        terms = sorted(t for t in vocab if not t.endswith("\x00"))
+        meta["nul_terms"] = {t: int(vocab[t]) for t in vocab if t.endswith("\x00")}
+        np.save(tmp / "terms.npy", np.array(terms, dtype=str) if terms else np.zeros(0, dtype="<U1"))
+        np.save(tmp / "columns.npy", np.array([vocab[t] for t in terms], dtype=np.int64))
+        np.save(tmp / "idf.npy", vectorizer.idf_ if vectorizer.use_idf else np.ones(len(vocab)))
+
+    meta["matrix_shape"] = _save_csr(tmp, "matrix", model["matrix"])
+    _save_strings(tmp, "summaries", model["summaries"])
+    if index is not None:
+        segments = getattr(index, "segments", [])
+        postings = hstack([index.postings] + segments, format="csr") if segments else index.postings
+        meta["index"] = {
+            "n_rows": index.n_rows,
+            "max_query_terms": index.max_query_terms,
+            "shape": _save_csr(tmp, "postings", postings),
+        }
+
+    with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    shutil.rmtree(out, ignore_errors=True)
+    os.replace(tmp, out)
+    return out
+
+def load_summarizer(flat_dir):
+    """Maps a flat summarizer export read-only. Returns (model dict, SummaryIndex or None).
+
+    Load time does not grow with the model: arrays are memory-mapped, so every
+    process serving the same export shares one page-cache copy.
+    """
+    flat_dir = Path(flat_dir)
+    with open(flat_dir / "meta.json", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != FLAT_FORMAT:
+        raise ValueError(f"{flat_dir}: unsupported flat model format {meta.get('format')}")
+
+    params = dict(meta["params"])
+    if "ngram_range" in params:
+        params["ngram_range"] = tuple(params["ngram_range"])
+    if meta["vectorizer"] == "hashing":
+        from sklearn.feature_extraction.text import HashingVectorizer
+        vectorizer = HashingVectorizer(**params)
+    else:
+        vectorizer = FlatTfidfVectorizer(params, _load(flat_dir, "terms"), _load(flat_dir, "columns"), _load(flat_dir, "idf"),
+                                         meta.get("nul_terms"))
+
+    model = {
+        "vectorizer": vectorizer,
+        "matrix": _load_csr(flat_dir, "matrix", meta["matrix_shape"]),
+        "summaries": StringTable(flat_dir, "summaries"),
+    }
+    index = None
+    if "index" in meta:
+        info = meta["index"]
+        index = SummaryIndex.from_postings(_load_csr(flat_dir, "postings", info["shape"]),
+                                           info["n_rows"], info["max_query_terms"])
+    return model, index
+
+def classifier_dir(model_dir):
+    return Path(model_dir) / "flat"
+
+def _tree_arrays(tree):
+    """In-order leaves of one booster tree, and per split node the bits of the leaves left of it."""
+    left, right = tree["left_children"], tree["right_children"]
+    leaves, nodes = [], []
+
+    def walk(node):
+        # Returns the [first, last) in-order numbers of the leaves under `node`.
+        if left[node] == -1:
+            leaves.append(node)
+            return len(leaves) - 1, len(leaves)
+        first, middle = walk(left[node])
+        _, last = walk(right[node])
+        nodes.append((node, (1 << middle) - (1 << first)))
+        return first, last
+
+    walk(0)
+    return leaves, nodes
+
+def _save_trees(booster, out):
+    """Writes a gbtree booster as the flat arrays `TreeEnsemble` evaluates.
+
+    Every split node gets its feature, threshold and the bitmask of the leaves
+    in its left subtree, which are ruled out when the row goes right. Nodes are
+    stored by their rank within their tree, so the r-th nodes of all trees are
+    one contiguous block. Returns the "trees" entry of meta.json.
+    """
+    learner = json.loads(booster.save_raw("json"))["learner"]
+    objective = learner["objective"]["name"]
+    if learner["gradient_booster"]["name"] != "gbtree" or not objective.startswith(("multi:", "binary:")):
+        raise ValueError(f"cannot export a {learner['gradient_booster']['name']} booster with objective {objective}")
+    model = learner["gradient_booster"]["model"]
+    params = learner["learner_model_param"]
+    base = [float(v) for v in params["base_score"].strip("[]").split(",")]
+    if objective == "binary:logistic":
+        base = [float(np.log(b / (1 - b))) for b in base]
+    n_classes = max(int(params.get("num_class", 0)), 1)
+    base = (base * n_classes)[:n_classes] if len(base) == 1 else base
+
+    features, thresholds, masks, missing_right, trees, ranks = [], [], [], [], [], []
+    leaf_values, leaf_offsets = [], []
+    max_leaves = 1
+    for t, tree in enumerate(model["trees"]):
+        if any(tree["split_type"]):
+            raise ValueError("cannot export a booster with categorical splits")
+        leaves, nodes = _tree_arrays(tree)
+        max_leaves = max(max_leaves, len(leaves))
+        leaf_offsets.append(len(leaf_values))
+        leaf_values.extend(tree["split_conditions"][leaf] for leaf in leaves)
+        for rank, (node, mask) in enumerate(sorted(nodes)):
+            features.append(tree["split_indices"][node])
+            thresholds.append(tree["split_conditions"][node])
+            masks.append(mask)
+            missing_right.append(not tree["default_left"][node])
+            trees.append(t)
+            ranks.append(rank)
+    if max_leaves > 64:
+        raise ValueError(f"cannot export trees with more than 64 leaves ({max_leaves})")
+
+    order = np.lexsort((trees, ranks))
+    ranks = np.asarray(ranks, dtype=np.int64)[order]
+    np.save(out / "node_features.npy", np.asarray(features, dtype=np.int32)[order])
+    np.save(out / "node_thresholds.npy", np.asarray(thresholds, dtype=np.float32)[order])
+    np.save(out / "node_masks.npy", np.asarray(masks, dtype=np.uint32 if max_leaves <= 32 else np.uint64)[order])
+    np.save(out / "node_missing_right.npy", np.asarray(missing_right, dtype=bool)[order])
+    np.save(out / "node_trees.npy", np.asarray(trees, dtype=np.int32)[order])
+    np.save(out / "rank_starts.npy", np.searchsorted(ranks, np.arange((ranks.max() + 2) if len(ranks) else 1)))
+    np.save(out / "leaf_values.npy", np.asarray(leaf_values, dtype=np.float32))
+    np.save(out / "leaf_offsets.npy", np.asarray(leaf_offsets, dtype=np.int64))
+    np.save(out / "tree_classes.npy", np.asarray(model["tree_info"], dtype=np.int32))
+    return {"objective": objective, "base_margin": base}
+
+def save_classifier(model_dir):
+    """Exports the heading classifier and its encoders next to the joblib files.
+
+    The booster's trees become flat arrays that `TreeEnsemble` scores with
+    NumPy alone, and each encoder is reduced to its classes, so loading the
+    export imports neither XGBoost nor sklearn.
+    """
+    import joblib
+
+    model_dir = Path(model_dir)
+    out = classifier_dir(model_dir)
+    tmp = out.with_name(out.name + f".{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    clf = joblib.load(model_dir / "heading_classifier.joblib")
+    meta = {"format": FLAT_FORMAT, "sources": _source_digests(*(model_dir / name for name in MODEL_FILES)),
+            "trees": _save_trees(clf.get_booster(), tmp), "classes": {}}
+    for name in ("label", "font", "punctuation"):
+        meta["classes"][name] = [str(c) for c in joblib.load(model_dir / f"{name}_encoder.joblib").classes_]
+    with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    shutil.rmtree(out, ignore_errors=True)
+    os.replace(tmp, out)
+    return out
+
+class TreeEnsemble:
+    """NumPy evaluator of an exported gradient-boosted tree ensemble.
+
+    Scores rows the QuickScorer way: every split node whose test sends a row
+    right clears the bits of the leaves on its left, and the lowest bit still
+    set in a tree's mask is the leaf the row exits at. Leaf values are summed
+    per class in tree order in float32, as XGBoost does, so margins and
+    predictions are identical to the booster's.
+    """
+
+    def __init__(self, flat_dir, trees):
+        for name in ("node_features", "node_thresholds", "node_masks", "node_missing_right", "node_trees",
+                     "rank_starts", "leaf_values", "leaf_offsets", "tree_classes"):
+            setattr(self, name, _load(flat_dir, name))
+        self.objective = trees["objective"]
+        self.base_margin = np.asarray(trees["base_margin"], dtype=np.float32)
+        self.class_trees = [np.flatnonzero(self.tree_classes == k) for k in range(len(self.base_margin))]
+        # A lone set bit converted to float has the bit's index as its exponent.
+        if self.node_masks.dtype == np.uint32:
+            self.float_type, self.int_type, self.mantissa_bits, self.bias = np.float32, np.int32, 23, 127
+        else:
+            self.float_type, self.int_type, self.mantissa_bits, self.bias = np.float64, np.int64, 52, 1023
+
+    def margin(self, X):
+        """Raw per-class scores, (n_rows, n_classes) float32, like `inplace_predict(predict_type="margin")`."""
+        X = np.asarray(X, dtype=np.float32)
+        if not len(X):
+            return np.zeros((0, len(self.base_margin)), dtype=np.float32)
+        return np.concatenate([self._margin(X[i:i + TREE_CHUNK_ROWS]) for i in range(0, len(X), TREE_CHUNK_ROWS)])
+
+    def _margin(self, X):
+        values = X.T[self.node_features]
+        right = values >= self.node_thresholds[:, None]
+        missing = np.isnan(values)
+        if missing.any():
+            right |= missing & self.node_missing_right[:, None]
+        cleared = right * self.node_masks[:, None]
+
+        exits = np.zeros((len(self.leaf_offsets), len(X)), dtype=self.node_masks.dtype)
+        starts = self.rank_starts.tolist()
+        for start, end in zip(starts[:-1], starts[1:]):
+            exits[self.node_trees[start:end]] |= cleared[start:end]
+        exits = ~exits
+        lowest = (exits & (~exits + 1)).astype(self.float_type).view(self.int_type)
+        leaves = (lowest >> self.mantissa_bits) - self.bias
+        leaf_values = self.leaf_values[self.leaf_offsets[:, None] + leaves]
+        return np.stack([np.add.reduce(leaf_values[trees], axis=0, initial=base)
+                         for trees, base in zip(self.class_trees, self.base_margin)], axis=1)
+
+    def predict(self, X):
+        """Class indices, as XGBClassifier.predict returns them."""
+        margin = self.margin(X)
+        if margin.shape[1] == 1:
+            if self.objective == "binary:logistic":
+                return (1 / (1 + np.exp(-margin[:, 0])) > 0.5).astype(np.int64)
+            return (margin[:, 0] > 0).astype(np.int64)
+        # Softmax as XGBoost computes it, so near-ties resolve the same way.
+        return np.exp(margin - margin.max(axis=1, keepdims=True)).argmax(axis=1)
+
+def load_classifier(model_dir):
+    """Loads an exported classifier. Returns (TreeEnsemble, {encoder name: classes})."""
+    out = classifier_dir(model_dir)
+    with open(out / "meta.json", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != FLAT_FORMAT:
+        raise ValueError(f"{out}: unsupported flat model format {meta.get('format')}")
+    return TreeEnsemble(out, meta["trees"]), meta["classes"]
+
+def verify_classifier(model_dir, input_root="input"):
+    """Checks that the exported classifier predicts exactly what the joblib XGBClassifier does.
+
+    Compares margins and predicted classes on every line of every bundled PDF,
+    before the prefilter. Returns True if all of them are identical.
+    """
+    import fitz
+    import joblib
+    from features import build_features, class_lookup
+    from layout import extract_layout
+
+    ensemble, classes = load_classifier(model_dir)
+    clf = joblib.load(Path(model_dir) / "heading_classifier.joblib")
+    font_lookup, punct_lookup = class_lookup(classes["font"]), class_lookup(classes["punctuation"])
+    rows = [build_features(extract_layout(fitz.open(path)), font_lookup, punct_lookup)[0]
+            for path in sorted(Path(input_root).glob("*/*.pdf"))]
+    X = np.vstack(rows) if rows else np.zeros((0, clf.n_features_in_), dtype=np.float32)
+    same_margin = np.array_equal(ensemble.margin(X), clf.get_booster().inplace_predict(X, predict_type="margin"))
+    same_class = np.array_equal(ensemble.predict(X), clf.predict(X))
+    print(f"{len(X)} lines: margins identical {same_margin}, predictions identical {same_class}")
+    return same_margin and same_class
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export models to the flat, memory-mapped format.")
+    parser.add_argument("--summarizer", nargs="*", default=[],
+                        help="Summarizer joblib files to export (their saved index is included).")
+    parser.add_argument("--classifier", metavar="MODEL_DIR", help="Export the heading classifier in this model dir.")
+    parser.add_argument("--verify", action="store_true",
+                        help="After exporting --classifier, check its predictions against XGBoost on input/*/*.pdf.")
+    args = parser.parse_args()
+
+    import joblib
+    for path in args.summarizer:
+        index = joblib.load(index_path(path)) if os.path.exists(index_path(path)) else None
+        print(f"{path} -> {save_summarizer(joblib.load(path), path, index)}")
+    if args.classifier:
+        print(f"{args.classifier} -> {save_classifier(args.classifier)}")
+        if args.verify and not verify_classifier(args.classifier):
+            raise SystemExit(1)
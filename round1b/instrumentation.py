@@ -0,0 +1,174 @@
+# instrumentation.py
+
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+_NO_STAGE = nullcontext()
+
+class Timings:
+    """Wall-clock seconds and counters per stage for one document or case.
+
+    Stage names with a dot (e.g. "rules.form_check") are sub-stages of the
+    part before the dot and are already included in its time.
+    """
+
+    __slots__ = ("seconds", "counters")
+
+    def __init__(self):
+        self.seconds = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def to_dict(self):
+        return {
+            "stages": {name: round(sec, 6) for name, sec in self.seconds.items()},
+            "counters": dict(self.counters),
+        }
+
+class _NullTimings:
+    """Stand-in used when instrumentation is off: every hook is a no-op."""
+
+    __slots__ = ()
+
+    def stage(self, name):
+        return _NO_STAGE
+
+    def count(self, name, n=1):
+        pass
+
+NULL_TIMINGS = _NullTimings()
+
+class Instrumentation:
+    """Options and collected case performance blocks for one instrumented run.
+
+    `profile_dir` saves a cProfile dump per document; `trace_memory` records the
+    tracemalloc peak of each document's analysis. `documents` holds document
+    blocks per case name until `add_case` folds them into `cases`, and
+    `prefetch` a prefetching run's per-case I/O summary until `add_case`
+    adds it to the case block.
+    """
+
+    def __init__(self, profile_dir=None, trace_memory=False):
+        self.profile_dir = str(profile_dir) if profile_dir else None
+        self.trace_memory = trace_memory
+        self.documents = {}
+        self.prefetch = {}
+        self.cases = {}
+
+    def add_case(self, name, documents, timings):
+        """Builds, stores and returns the performance block of one case.
+
+        Case stages are the case's own stages (ranking, summarization) plus the
+        sums of its documents' stages; the document blocks are kept as a list.
+        """
+        stages, counters = {}, {}
+        for doc in documents:
+            for stage, sec in doc["stages"].items():
+                stages[stage] = stages.get(stage, 0.0) + sec
+            for counter, n in doc["counters"].items():
+                counters[counter] = counters.get(counter, 0) + n
+        for stage, sec in timings.seconds.items():
+            stages[stage] = stages.get(stage, 0.0) + sec
+        for counter, n in timings.counters.items():
+            counters[counter] = counters.get(counter, 0) + n
+
+        total = sum(doc["total_seconds"] for doc in documents)
+        total += sum(sec for stage, sec in timings.seconds.items() if "." not in stage)
+        perf = {
+            "total_seconds": round(total, 6),
+            "stages": {stage: round(sec, 6) for stage, sec in stages.items()},
+            "counters": counters,
+            "documents": documents,
+        }
+        if name in self.prefetch:
+            perf["prefetch"] = self.prefetch.pop(name)
+        self.cases[name] = perf
+        return perf
+
+@contextmanager
+def capture(name, profile_dir=None, trace_memory=False):
+    """Optionally wraps one document's analysis in cProfile and/or tracemalloc.
+
+    Yields a dict that is filled with `peak_traced_mb` and `profile` (the dump
+    path) on exit, for whichever captures were enabled.
+    """
+    result = {}
+    profiler = None
+    if profile_dir:
+        import cProfile
+        profiler = cProfile.Profile()
+    if trace_memory:
+        import tracemalloc
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield result
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            path = Path(profile_dir) / f"{name}.prof"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(str(path))
+            result["profile"] = str(path)
+        if trace_memory:
+            result["peak_traced_mb"] = round((tracemalloc.get_traced_memory()[1] - base) / 2**20, 3)
+            if started:
+                tracemalloc.stop()
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def write_prometheus(path, cases):
+    """Writes case performance blocks as a Prometheus text-format file.
+
+    The file is replaced atomically, so a node_exporter textfile collector never
+    reads a partial write.
+    """
+    lines = [
+        "# HELP round1b_stage_seconds Wall-clock seconds spent in a pipeline stage.",
+        "# TYPE round1b_stage_seconds gauge",
+    ]
+    for case, perf in cases.items():
+        for stage, sec in perf["stages"].items():
+            lines.append(f'round1b_stage_seconds{{case="{_label(case)}",stage="{_label(stage)}"}} {sec}')
+    lines += [
+        "# HELP round1b_document_seconds Wall-clock seconds spent analyzing one document.",
+        "# TYPE round1b_document_seconds gauge",
+    ]
+    for case, perf in cases.items():
+        for doc in perf["documents"]:
+            lines.append(
+                f'round1b_document_seconds{{case="{_label(case)}",document="{_label(doc["document"])}"}} '
+                f'{doc["total_seconds"]}'
+            )
+    lines += [
+        "# HELP round1b_events_total Pipeline counters (pages, headings, cache hits, ...).",
+        "# TYPE round1b_events_total counter",
+    ]
+    for case, perf in cases.items():
+        for name, value in perf["counters"].items():
+            lines.append(f'round1b_events_total{{case="{_label(case)}",name="{_label(name)}"}} {value}')
+
+    path = Path(path)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, path)
@@ -0,0 +1,38 @@
+import numpy as np
+from records import PageLayout, StringPool
+
+def extract_layout(doc, start=0, stop=None):
+    """Parses every page (or pages `start` to `stop`) once into a columnar line/span table.
+
+    Returns one PageLayout per page. Both the classifier features in main.py and
+    the rules in fallback_utils read from it, so `get_text("dict")` runs once
+    per page. Font names and span texts go through a per-document string pool,
+    so repeated headers, footers and fonts are stored once.
+    """
+    pool = StringPool()
+    pages = []
+    for page in doc.pages(start, stop):
+        texts, fonts, sizes, bboxes, line_starts = [], [], [], [], [0]
+        for block in page.get_text("dict")["blocks"]:
+            if block["type"] != 0:
+                continue
+            for line in block["lines"]:
+                for span in line.get("spans", []):
+                    texts.append(pool(span["text"]))
+                    fonts.append(pool(span["font"]))
+                    sizes.append(span["size"])
+                    bboxes.append(span["bbox"])
+                line_starts.append(len(texts))
+        pages.append(PageLayout(
+            page.rect.height,
+            texts,
+            fonts,
+            np.asarray(sizes, dtype=np.float64),
+            np.asarray(bboxes, dtype=np.float64).reshape(-1, 4),
+            np.asarray(line_starts, dtype=np.int32),
+        ))
+    return pages
+
+def page_text(page):
+    """Rebuilds the plain text of a page, matching `page.get_text("text")`."""
+    return page.text()
@@ -1,164 +1,405 @@
 import os
 import json
-import joblib
 import fitz
+import numpy as np
 import re
+import argparse
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from itertools import islice
 from pathlib import Path
 from datetime import datetime
-from fallback_utils import extract_title, extract_headings_structured
-from subsummarizer import predict_summary
+from doc_cache import MODEL_FILES, OutlineCache, QueryCache
+from doc_store import iter_text_lines
+from features import build_features, class_lookup, encoder_lookup
+from flat_model import classifier_dir, is_current, load_classifier
+from fallback_utils import extract_headings_structured, form_headings, resolve_rule_headings, rule_candidates
+from instrumentation import NULL_TIMINGS, Instrumentation, Timings, capture, write_prometheus
+from layout import extract_layout, page_text
+from records import OutlineEntry
+from prefetch import PREFETCH_DEPTH, PREFETCH_MAX_MB, PdfPrefetcher
+from prefilter import DeferredPrefilter, LinePrefilter, layout_stats, merge_stats
+from ranking import SectionIndex, section_bodies
+from subsummarizer import predict_summaries
+from summary_index import index_path
+import subsummarizer
 
 INPUT_ROOT = Path("input")
 OUTPUT_ROOT = Path("output")
-OUTPUT_ROOT.mkdir(exist_ok=True)
+MODEL_DIR = Path("model")
+MAX_SECTIONS_PER_DOCUMENT = 5
 
-clf = joblib.load("model/heading_classifier.joblib")
-label_encoder = joblib.load("model/label_encoder.joblib")
-font_encoder = joblib.load("model/font_encoder.joblib")
-punct_encoder = joblib.load("model/punctuation_encoder.joblib")
+clf = None
+label_classes = None
+font_lookup = None
+punct_lookup = None
 
-features_cols = [
-    "font_size", "font_name_encoded", "is_bold", "is_italic",
-    "x0", "x1", "y0", "y1",
-    "char_count", "capital_ratio", "line_y_ratio",
-    "punctuation_encoded", "has_numbering"
-]
+def load_models():
+    """Loads the heading classifier and encoders once per process.
+
+    A current flat export (see flat_model.py) is preferred over the joblib files;
+    it loads without importing XGBoost, sklearn or joblib.
+    """
+    global clf, label_classes, font_lookup, punct_lookup
+    if clf is not None:
+        return
+    if is_current(classifier_dir(MODEL_DIR), *(MODEL_DIR / name for name in MODEL_FILES)):
+        clf, classes = load_classifier(MODEL_DIR)
+        label_classes = np.array(classes["label"], dtype=object)
+        font_lookup = class_lookup(classes["font"])
+        punct_lookup = class_lookup(classes["punctuation"])
+        return
+    import joblib
+    clf = joblib.load(MODEL_DIR / "heading_classifier.joblib")
+    label_classes = joblib.load(MODEL_DIR / "label_encoder.joblib").classes_
+    font_lookup = encoder_lookup(joblib.load(MODEL_DIR / "font_encoder.joblib"))
+    punct_lookup = encoder_lookup(joblib.load(MODEL_DIR / "punctuation_encoder.joblib"))
 
 def normalize(text):
     return re.sub(r"\s+", " ", text.strip()).lower()
 
-def encode_punctuation(p):
-    return punct_encoder.transform([p])[0] if p in punct_encoder.classes_ else 0
+def parse_query(meta):
+    """Pulls the persona role and job task out of a challenge1b_input.json payload."""
+    persona = meta.get("persona", {}).get("role", "") or meta.get("persona", "")
+    job = meta.get("job_to_be_done", {}).get("task", "") or meta.get("job_to_be_done", "")
+    return persona, job
 
-def relevance_score(section, persona, job):
-    section = section.lower()
-    keywords = (persona + " " + job).lower().split()
-    return sum(1 for word in keywords if word in section)
+def read_case(case_dir):
+    with open(case_dir / "challenge1b_input.json", "r", encoding="utf-8") as f:
+        return parse_query(json.load(f))
 
-for case_dir in sorted(INPUT_ROOT.glob("challenge_case_*")):
-    input_json = case_dir / "challenge1b_input.json"
-    with open(input_json, "r", encoding="utf-8") as f:
-        meta = json.load(f)
+def heading_rows(X):
+    """(row, label) of every feature-matrix row the heading classifier labels H1-H3."""
+    load_models()
+    if not len(X):
+        return []
+    labels = label_classes[clf.predict(X)]
+    return [(i, label) for i, label in enumerate(labels) if label in {"H1", "H2", "H3"}]
 
-    persona = meta.get("persona", {}).get("role", "") or meta.get("persona", "")
-    job = meta.get("job_to_be_done", {}).get("task", "") or meta.get("job_to_be_done", "")
-    input_docs = []
-    extracted_sections = []
-    subsection_analysis = []
-    seen_titles = set()
+def classify_lines(X, line_texts, line_pages):
+    """Runs the heading classifier over a feature matrix and keeps H1-H3 lines."""
+    return [OutlineEntry(label, line_texts[i], line_pages[i]) for i, label in heading_rows(X)]
 
-    for pdf_path in sorted(case_dir.glob("*.pdf")):
-        doc = fitz.open(pdf_path)
-        input_docs.append(pdf_path.name)
+def merge_outlines(outline_model, outline_rule):
+    """Concatenates model and rule headings, dropping repeats of (text, page, level)."""
+    seen = set()
+    final_outline = []
+    for item in outline_model + outline_rule:
+        key = (normalize(item.text), item.page, item.level)
+        if key not in seen:
+            final_outline.append(item)
+            seen.add(key)
+    return final_outline
 
-        lines_raw, features = [], []
-        for page_num, page in enumerate(doc):
-            blocks = page.get_text("dict")["blocks"]
-            page_height = page.rect.height
+def extract_outline(layout, timings=NULL_TIMINGS):
+    """Merges classifier and rule-based headings into one deduplicated outline.
 
-            for block in blocks:
-                if block["type"] != 0:
-                    continue
-                for line in block["lines"]:
-                    spans = line.get("spans", [])
-                    if not spans:
-                        continue
-                    text = " ".join(span["text"] for span in spans).strip()
-                    if not text:
-                        continue
-
-                    font_sizes = [span["size"] for span in spans]
-                    font_names = [span["font"] for span in spans]
-                    is_bold = any("Bold" in f for f in font_names)
-                    is_italic = any("Italic" in f for f in font_names)
-
-                    x0 = min(span["bbox"][0] for span in spans)
-                    x1 = max(span["bbox"][2] for span in spans)
-                    y0 = min(span["bbox"][1] for span in spans)
-                    y1 = max(span["bbox"][3] for span in spans)
-
-                    avg_font_size = sum(font_sizes) / len(font_sizes)
-                    char_count = len(text)
-                    capital_ratio = sum(1 for c in text if c.isupper()) / max(len(text), 1)
-                    line_y_ratio = y0 / page_height
-                    punct = text[-1] if text and text[-1] in ":.?" else "none"
-                    has_numbering = bool(re.match(r"^\d+(\.\d+)*", text.strip()))
-                    font_encoded = font_encoder.transform([font_names[0]])[0] if font_names[0] in font_encoder.classes_ else 0
-                    punct_encoded = encode_punctuation(punct)
-
-                    features.append([
-                        avg_font_size, font_encoded, int(is_bold), int(is_italic),
-                        x0, x1, y0, y1,
-                        char_count, capital_ratio, line_y_ratio,
-                        punct_encoded, int(has_numbering)
-                    ])
-                    lines_raw.append({"text": text, "page": page_num})
-
-        outline_model = []
-        if features:
-            import pandas as pd
-            X_df = pd.DataFrame(features, columns=features_cols)
-            preds = clf.predict(X_df)
-            labels = label_encoder.inverse_transform(preds)
-
-            for i, label in enumerate(labels):
-                if label in {"H1", "H2", "H3"}:
-                    outline_model.append({
-                        "level": label,
-                        "text": lines_raw[i]["text"],
-                        "page": lines_raw[i]["page"]
-                    })
-
-        outline_rule = extract_headings_structured(doc)
-        all_outline = outline_model + outline_rule
-
-        seen = set()
-        final_outline = []
-        for item in all_outline:
-            key = (normalize(item["text"]), item["page"], item["level"])
-            if key not in seen:
-                final_outline.append(item)
-                seen.add(key)
-
-        scored = sorted([
-            (relevance_score(h["text"], persona, job), h)
-            for h in final_outline
-        ], key=lambda x: -x[0])
-
-        top_sections = [s for score, s in scored if score >= 2][:5]
-
-        for rank, section in enumerate(top_sections, 1):
-            norm_title = normalize(section["text"])
-            title_key = (pdf_path.name, section["page"], norm_title)
-            if title_key in seen_titles:
-                continue
-            seen_titles.add(title_key)
-
-            extracted_sections.append({
-                "document": pdf_path.name,
-                "page_number": section["page"],
-                "section_title": section["text"],
-                "importance_rank": rank
-            })
+    Lines the prefilter rules out (long lines, page numbers, running headers
+    and small body text) never reach the classifier.
+    """
+    load_models()
+    with timings.stage("prefilter"):
+        prefilter = LinePrefilter(layout)
+    with timings.stage("features"):
+        X, line_texts, line_pages = build_features(layout, font_lookup, punct_lookup, prefilter)
+    with timings.stage("classify"):
+        outline_model = classify_lines(X, line_texts, line_pages)
+    with timings.stage("rules"):
+        outline_rule = extract_headings_structured(layout, timings)
+    with timings.stage("merge"):
+        outline = merge_outlines(outline_model, outline_rule)
+    timings.count("lines", len(line_texts))
+    timings.count("model_headings", len(outline_model))
+    timings.count("rule_headings", len(outline_rule))
+    return outline
+
+def analyze_document(pdf_path, cache=None, timings=NULL_TIMINGS, data=None):
+    """Returns the outline and per-page text of a PDF, from the outline cache when possible.
+
+    `data` is the PDF's content if it was already read (see prefetch.py).
+    """
+    if cache is not None:
+        with timings.stage("cache"):
+            key = cache.key(pdf_path, data)
+            entry = cache.get(key)
+        if entry is not None:
+            timings.count("cache_hits")
+            return [OutlineEntry.from_dict(item) for item in entry["outline"]], entry["pages"]
+        timings.count("cache_misses")
+
+    with timings.stage("parse"):
+        layout = extract_layout(fitz.open(pdf_path) if data is None else fitz.open(stream=data, filetype="pdf"))
+    outline = extract_outline(layout, timings)
+    with timings.stage("page_text"):
+        pages = [page_text(page) for page in layout]
+
+    if cache is not None:
+        with timings.stage("cache"):
+            cache.put(key, [item.to_dict() for item in outline], pages)
+    return outline, pages
+
+def analyze_shard(pdf_path, start, stop, timed=False, profile_dir=None, trace_memory=False, data=None):
+    """Map step of a sharded analysis: the per-page work on pages [start, stop), for merge_shards."""
+    pdf_path = Path(pdf_path)
+    timings = Timings() if timed else NULL_TIMINGS
+    began = time.perf_counter()
+    with capture(f"{pdf_path.parent.name}/{pdf_path.stem}.{start}-{stop}", profile_dir, trace_memory) as extra:
+        load_models()
+        with timings.stage("parse"):
+            doc = fitz.open(pdf_path) if data is None else fitz.open(stream=data, filetype="pdf")
+            layout = extract_layout(doc, start, stop)
+        with timings.stage("prefilter"):
+            stats = layout_stats(layout)
+            prefilter = DeferredPrefilter()
+        with timings.stage("features"):
+            X, line_texts, line_pages = build_features(layout, font_lookup, punct_lookup, prefilter, start)
+        with timings.stage("classify"):
+            headings = [(label, line_texts[i], line_pages[i], *prefilter.rows[i]) for i, label in heading_rows(X)]
+        with timings.stage("rules"):
+            form = None
+            if start == 0:
+                with timings.stage("rules.form_check"):
+                    form = form_headings(layout[0])
+            h1_font_sizes, candidates = [], []
+            if form is None:
+                with timings.stage("rules.lines"):
+                    h1_font_sizes, candidates = rule_candidates(layout, start)
+        with timings.stage("page_text"):
+            pages = [page_text(page) for page in layout]
+    timings.count("lines", len(line_texts))
+
+    shard = {"prefilter": stats, "headings": headings, "form": form,
+             "h1_font_sizes": h1_font_sizes, "rule_candidates": candidates, "pages": pages}
+    if timed:
+        shard["performance"] = {"pages": [start, stop], "total_seconds": round(time.perf_counter() - began, 6),
+                                **timings.to_dict(), **extra}
+    return shard
+
+def merge_shards(shards, timings=NULL_TIMINGS):
+    """Reduce step: the document outline from its shards' results, in page order, as extract_outline gives it."""
+    with timings.stage("prefilter"):
+        prefilter = LinePrefilter.from_stats(merge_stats(shard["prefilter"] for shard in shards))
+        outline_model = [OutlineEntry(label, text, page)
+                         for shard in shards for label, text, page, *row in shard["headings"]
+                         if prefilter.keep(text, *row)]
+    with timings.stage("rules"):
+        outline_rule = shards[0]["form"]
+        if outline_rule is None:
+            outline_rule = resolve_rule_headings([size for shard in shards for size in shard["h1_font_sizes"]],
+                                                 [line for shard in shards for line in shard["rule_candidates"]])
+    with timings.stage("merge"):
+        outline = merge_outlines(outline_model, outline_rule)
+    timings.count("model_headings", len(outline_model))
+    timings.count("rule_headings", len(outline_rule))
+    return outline
+
+class ShardedAnalysis:
+    """One PDF analyzed as page-range shards; `result()` returns what analyze_document would."""
+
+    def __init__(self, pool, pdf_path, n_pages, shard_pages, cache=None, instrument=None, data=None):
+        self.pdf_path = Path(pdf_path)
+        self.cache = cache
+        self.instrument = instrument
+        self.timings = Timings() if instrument is not None else NULL_TIMINGS
+        self.shards = []
+        self.entry = None
+        if cache is not None:
+            with self.timings.stage("cache"):
+                self.key = cache.key(pdf_path, data)
+                self.entry = cache.get(self.key)
+            if self.entry is not None:
+                return
+
+        task = analyze_shard
+        if instrument is not None:
+            task = partial(analyze_shard, timed=True, profile_dir=instrument.profile_dir,
+                           trace_memory=instrument.trace_memory)
+        for start in range(0, n_pages, shard_pages):
+            stop = min(start + shard_pages, n_pages)
+            if pool is None:
+                self.shards.append(task(pdf_path, start, stop, data=data))
+            else:
+                self.shards.append(pool.submit(task, pdf_path, start, stop))
+
+    def result(self):
+        timings = self.timings
+        if self.entry is not None:
+            timings.count("cache_hits")
+            shards = []
+            outline = [OutlineEntry.from_dict(item) for item in self.entry["outline"]]
+            pages = self.entry["pages"]
+        else:
+            shards = [shard if isinstance(shard, dict) else shard.result() for shard in self.shards]
+            outline = merge_shards(shards, timings)
+            pages = [text for shard in shards for text in shard["pages"]]
+            if self.cache is not None:
+                timings.count("cache_misses")
+                with timings.stage("cache"):
+                    self.cache.put(self.key, [item.to_dict() for item in outline], pages)
+        if self.instrument is None:
+            return outline, pages
+
+        # Shard work counts towards the document as if it had run in one process.
+        total = sum(sec for stage, sec in timings.seconds.items() if "." not in stage)
+        blocks = [shard.pop("performance") for shard in shards]
+        for block in blocks:
+            total += block["total_seconds"]
+            for stage, sec in block["stages"].items():
+                timings.seconds[stage] = timings.seconds.get(stage, 0.0) + sec
+            for counter, n in block["counters"].items():
+                timings.count(counter, n)
+        timings.count("pages", len(pages))
+        timings.count("headings", len(outline))
+        if blocks:
+            timings.count("shards", len(blocks))
+        return outline, pages, {"document": self.pdf_path.name, "total_seconds": round(total, 6),
+                                **timings.to_dict(), "shards": blocks}
+
+def submit_document(pool, pdf_path, cache=None, analyze=analyze_document, shard_pages=None, instrument=None,
+                    data=None):
+    """Starts analyzing one PDF, in shards if it has more than `shard_pages` pages; returns a future."""
+    if shard_pages:
+        doc = fitz.open(pdf_path) if data is None else fitz.open(stream=data, filetype="pdf")
+        n_pages = doc.page_count
+        doc.close()
+        if n_pages > shard_pages:
+            return ShardedAnalysis(pool, pdf_path, n_pages, shard_pages, cache, instrument, data)
+    if pool is not None:
+        return pool.submit(analyze, pdf_path, cache)
+    future = Future()
+    future.set_result(analyze(pdf_path, cache, data=data))
+    return future
+
+def analyze_document_timed(pdf_path, cache=None, profile_dir=None, trace_memory=False, data=None):
+    """analyze_document plus the document's performance block: (outline, pages, performance)."""
+    pdf_path = Path(pdf_path)
+    timings = Timings()
+    start = time.perf_counter()
+    with capture(f"{pdf_path.parent.name}/{pdf_path.stem}", profile_dir, trace_memory) as extra:
+        outline, pages = analyze_document(pdf_path, cache, timings, data)
+    total = time.perf_counter() - start
+    timings.count("pages", len(pages))
+    timings.count("headings", len(outline))
+    return outline, pages, {"document": pdf_path.name, "total_seconds": round(total, 6), **timings.to_dict(), **extra}
+
+def document_analyzer(instrument=None):
+    """analyze_document, or its timed variant configured by an Instrumentation."""
+    if instrument is None:
+        return analyze_document
+    return partial(analyze_document_timed, profile_dir=instrument.profile_dir, trace_memory=instrument.trace_memory)
+
+def add_io_timings(performance, item):
+    """Adds the time spent waiting for a prefetched PDF, and reading it, to its document block."""
+    wait = round(item.wait_seconds, 6)
+    performance["stages"]["io_wait"] = wait
+    performance["total_seconds"] = round(performance["total_seconds"] + wait, 6)
+    performance["prefetch"] = {"read_seconds": round(item.read_seconds, 6), "bytes": len(item.data)}
+
+def prefetch_summary(items, prefetcher):
+    """A case's prefetch block: its PDFs' read and wait times, and how much reading overlapped analysis."""
+    read = sum(item.read_seconds for item in items)
+    wait = sum(item.wait_seconds for item in items)
+    return {
+        "documents": len(items),
+        "bytes_read": sum(len(item.data) for item in items),
+        "read_seconds": round(read, 6),
+        "wait_seconds": round(wait, 6),
+        "overlapped_seconds": round(max(read - wait, 0.0), 6),
+        "peak_buffered_bytes": prefetcher.peak_buffered,
+    }
+
+def collect_analysis(name, result, documents=None):
+    """(name, outline, pages) from an analyzer result, keeping its performance block if timed."""
+    if documents is None:
+        return (name, *result)
+    outline, pages, perf = result
+    documents.append(perf)
+    return name, outline, pages
+
+def rank_sections(analyses, persona, job):
+    """Ranks the sections of a whole collection against the persona/job query.
 
+    `analyses` holds (pdf_name, outline, pages) per document. All headings and
+    their bodies go into one BM25 index, so `importance_rank` is collection-wide.
+    Sections with no query term are dropped, as are repeated titles on the same
+    page and anything past MAX_SECTIONS_PER_DOCUMENT for one document. Returns
+    (pdf_name, heading, pages) tuples in rank order.
+    """
+    index = SectionIndex()
+    entries = []
+    for pdf_name, outline, pages in analyses:
+        for heading, body in zip(outline, section_bodies(outline, pages)):
+            index.add(heading.text, body)
+            entries.append((pdf_name, heading, pages))
+
+    return select_sections(entries, index.score(persona + " " + job))
+
+def select_sections(entries, scores):
+    """Picks (pdf_name, heading, ...) entries by descending score, as rank_sections does."""
+    order = sorted(range(len(entries)), key=lambda i: -scores[i])
+
+    selected = []
+    seen_titles = set()
+    per_document = {}
+    for i in order:
+        if scores[i] <= 0:
+            break
+        pdf_name, heading = entries[i][:2]
+        if per_document.get(pdf_name, 0) >= MAX_SECTIONS_PER_DOCUMENT:
+            continue
+        title_key = (pdf_name, heading.page, normalize(heading.text))
+        if title_key in seen_titles:
+            continue
+        seen_titles.add(title_key)
+        per_document[pdf_name] = per_document.get(pdf_name, 0) + 1
+        selected.append(entries[i])
+    return selected
+
+def section_paragraph(pages, page_number, max_lines=8):
+    """First non-empty lines of a section's page, as the summarizer was trained on."""
+    return " ".join(islice(iter_text_lines(pages[page_number]), max_lines))
+
+def build_case_output(persona, job, analyses, timings=NULL_TIMINGS):
+    """Ranks and summarizes a collection's analyses into the case output JSON."""
+    with timings.stage("ranking"):
+        selected = rank_sections(analyses, persona, job)
+
+    with timings.stage("summarization"):
+        paragraphs = []
+        for pdf_name, heading, pages in selected:
             try:
-                lines = doc[section["page"]].get_text().split("\n")
-                lines = [l.strip() for l in lines if l.strip()]
-                paragraph = " ".join(lines[:8])
-                summary = predict_summary(paragraph)
+                paragraphs.append(section_paragraph(pages, heading.page))
             except Exception:
-                summary = ""
+                paragraphs.append("")
+        summaries = predict_summaries(paragraphs)
+    timings.count("sections", len(selected))
 
-            subsection_analysis.append({
-                "document": pdf_path.name,
-                "page_number": section["page"],
-                "section_title": section["text"],
-                "refined_text": summary
-            })
+    input_documents = [pdf_name for pdf_name, _, _ in analyses]
+    return case_output(persona, job, input_documents, selected, summaries)
 
-    out_json = {
+def case_output(persona, job, input_documents, selected, summaries):
+    """The case output JSON for ranked (pdf_name, heading, ...) sections and their summaries."""
+    extracted_sections = []
+    subsection_analysis = []
+    for rank, (entry, summary) in enumerate(zip(selected, summaries), 1):
+        pdf_name, heading = entry[:2]
+        extracted_sections.append({
+            "document": pdf_name,
+            "page_number": heading.page,
+            "section_title": heading.text,
+            "importance_rank": rank
+        })
+        subsection_analysis.append({
+            "document": pdf_name,
+            "page_number": heading.page,
+            "section_title": heading.text,
+            "refined_text": summary
+        })
+
+    return {
         "metadata": {
-            "input_documents": input_docs,
+            "input_documents": input_documents,
             "persona": persona,
             "job_to_be_done": job,
             "processed_at": datetime.utcnow().isoformat()
@@ -167,6 +408,209 @@ for case_dir in sorted(INPUT_ROOT.glob("challenge_case_*")):
         "subsection_analysis": subsection_analysis
     }
 
+def open_query_cache(root, max_entries=1000, ttl_seconds=7 * 24 * 3600):
+    """QueryCache keyed on the heading models in MODEL_DIR and the summarizer model being served."""
+    summarizer = Path(subsummarizer.MODEL_PATH)
+    return QueryCache(root, max_entries, ttl_seconds, MODEL_DIR, [summarizer, Path(index_path(summarizer))])
+
+def lookup_query(query_cache, persona, job, pdf_paths, instrument=None, name="query"):
+    """Looks a query up in the QueryCache. Returns (key, output JSON or None).
+
+    A hit is returned with the request's own persona/job text and a fresh
+    `processed_at`; with an Instrumentation it gets a performance block of its own.
+    """
+    timings = Timings() if instrument is not None else NULL_TIMINGS
+    with timings.stage("query_cache"):
+        key = query_cache.key(persona, job, pdf_paths)
+        out_json = query_cache.get(key)
+    if out_json is None:
+        return key, None
+    out_json["metadata"].update(persona=persona, job_to_be_done=job, processed_at=datetime.utcnow().isoformat())
+    if instrument is not None:
+        timings.count("query_cache_hits")
+        out_json["metadata"]["performance"] = instrument.add_case(name, [], timings)
+    return key, out_json
+
+def store_query(query_cache, key, out_json):
+    """Caches an output JSON under a query key, without its performance block."""
+    metadata = {k: v for k, v in out_json["metadata"].items() if k != "performance"}
+    query_cache.put(key, {**out_json, "metadata": metadata})
+
+def rank_collection(pdf_paths, persona, job, cache=None, pool=None, instrument=None, shard_pages=None,
+                    query_cache=None, query_key=None):
+    """Answers one persona/job query over a list of PDFs and returns the output JSON.
+
+    With an Instrumentation, the output gets a `metadata.performance` block.
+    With `shard_pages`, longer documents are analyzed in page-range shards.
+    With a QueryCache, a repeated query is answered from it without any analysis;
+    pass the `query_key` of a lookup_query miss to only store the result.
+    """
+    key = query_key
+    if query_cache is not None and key is None:
+        key, out_json = lookup_query(query_cache, persona, job, pdf_paths, instrument)
+        if out_json is not None:
+            return out_json
+
+    analyze = document_analyzer(instrument)
+    documents = [] if instrument is not None else None
+    if pool is None and not shard_pages:
+        analyses = [collect_analysis(Path(p).name, analyze(p, cache), documents) for p in pdf_paths]
+    else:
+        futures = [(Path(p).name, submit_document(pool, p, cache, analyze, shard_pages, instrument)) for p in pdf_paths]
+        analyses = [collect_analysis(name, future.result(), documents) for name, future in futures]
+
+    timings = Timings() if instrument is not None else NULL_TIMINGS
+    out_json = build_case_output(persona, job, analyses, timings)
+    if query_cache is not None:
+        timings.count("query_cache_misses")
+        store_query(query_cache, key, out_json)
+    if instrument is not None:
+        out_json["metadata"]["performance"] = instrument.add_case("query", documents, timings)
+    return out_json
+
+def write_output(case_dir, out_json):
     out_path = OUTPUT_ROOT / f"{case_dir.name}.json"
-    with open(out_path, "w", encoding="utf-8") as f:
+    tmp = out_path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
         json.dump(out_json, f, indent=2)
+    os.replace(tmp, out_path)
+
+def find_cases():
+    """(case_dir, persona, job, sorted PDF paths) for every challenge case under INPUT_ROOT."""
+    cases = []
+    for case_dir in sorted(INPUT_ROOT.glob("challenge_case_*")):
+        persona, job = read_case(case_dir)
+        cases.append((case_dir, persona, job, sorted(case_dir.glob("*.pdf"))))
+    return cases
+
+def analyze_cases(workers=1, cache=None, instrument=None, shard_pages=None, prefetch=PREFETCH_DEPTH,
+                  prefetch_max_mb=PREFETCH_MAX_MB, todo=None):
+    """Yields (case_dir, persona, job, analyses) for the cases in `todo` (default: all of find_cases()).
+
+    Analyses come back in sorted document order however many workers or shards are used.
+    """
+    analyze = document_analyzer(instrument)
+    cases = find_cases() if todo is None else todo
+
+    def documents(case_dir):
+        return instrument.documents.setdefault(case_dir.name, []) if instrument is not None else None
+
+    if workers <= 1:
+        prefetcher = None
+        if prefetch:
+            prefetcher = PdfPrefetcher([p for case in cases for p in case[3]], prefetch, prefetch_max_mb * 1024 * 1024)
+            files = iter(prefetcher)
+        try:
+            for case_dir, persona, job, pdf_paths in cases:
+                docs = documents(case_dir)
+                analyses = []
+                items = []
+                for p in pdf_paths:
+                    item = next(files) if prefetcher is not None else None
+                    data = item.data if item is not None else None
+                    result = submit_document(None, p, cache, analyze, shard_pages, instrument, data).result()
+                    if item is not None and instrument is not None:
+                        add_io_timings(result[2], item)
+                        items.append(item)
+                    analyses.append(collect_analysis(p.name, result, docs))
+                if items:
+                    instrument.prefetch[case_dir.name] = prefetch_summary(items, prefetcher)
+                yield case_dir, persona, job, analyses
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=load_models) as pool:
+        pending = [
+            (case_dir, persona, job,
+             [(p.name, submit_document(pool, p, cache, analyze, shard_pages, instrument)) for p in pdf_paths])
+            for case_dir, persona, job, pdf_paths in cases
+        ]
+        for case_dir, persona, job, futures in pending:
+            docs = documents(case_dir)
+            yield case_dir, persona, job, [collect_analysis(name, future.result(), docs) for name, future in futures]
+
+def run(workers=1, cache=None, cases=None, instrument=None, shard_pages=None, prefetch=PREFETCH_DEPTH,
+        prefetch_max_mb=PREFETCH_MAX_MB, query_cache=None):
+    """Ranks and summarizes every challenge case and writes its output JSON.
+
+    `cases` can hold analyses from an earlier analyze_cases call, so a rerun
+    with another summarizer skips PDF analysis. With an Instrumentation, each
+    output gets a `metadata.performance` block. With a QueryCache, cases asked
+    before over the same documents and models are written straight from it.
+    Returns {file name: output JSON}.
+    """
+    OUTPUT_ROOT.mkdir(exist_ok=True)
+    outputs = {}
+    keys = {}
+    if cases is None:
+        todo = find_cases()
+        if query_cache is not None:
+            misses = []
+            for case_dir, persona, job, pdf_paths in todo:
+                key, out_json = lookup_query(query_cache, persona, job, pdf_paths, instrument, case_dir.name)
+                if out_json is None:
+                    keys[case_dir] = key
+                    misses.append((case_dir, persona, job, pdf_paths))
+                    continue
+                write_output(case_dir, out_json)
+                outputs[f"{case_dir.name}.json"] = out_json
+            todo = misses
+        cases = analyze_cases(workers, cache, instrument, shard_pages, prefetch, prefetch_max_mb, todo)
+    for case_dir, persona, job, analyses in cases:
+        timings = Timings() if instrument is not None else NULL_TIMINGS
+        out_json = build_case_output(persona, job, analyses, timings)
+        if case_dir in keys:
+            timings.count("query_cache_misses")
+            store_query(query_cache, keys[case_dir], out_json)
+        if instrument is not None:
+            documents = instrument.documents.pop(case_dir.name, [])
+            out_json["metadata"]["performance"] = instrument.add_case(case_dir.name, documents, timings)
+        write_output(case_dir, out_json)
+        outputs[f"{case_dir.name}.json"] = out_json
+    return outputs
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Persona-driven section ranking over input/challenge_case_*.")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", "1")),
+                        help="Worker processes for PDF analysis (0 = one per CPU, default 1 = serial).")
+    parser.add_argument("--shard-pages", type=int, default=int(os.environ.get("SHARD_PAGES", "0")),
+                        help="Split documents with more pages into page-range shards analyzed in parallel (0 = off).")
+    parser.add_argument("--prefetch", type=int, default=int(os.environ.get("PREFETCH_DEPTH", PREFETCH_DEPTH)),
+                        help=f"PDFs read ahead in the background by a serial run (0 = off, default {PREFETCH_DEPTH}).")
+    parser.add_argument("--prefetch-mb", type=int, default=PREFETCH_MAX_MB,
+                        help=f"Memory cap of the read-ahead buffers in MB (default {PREFETCH_MAX_MB}).")
+    parser.add_argument("--cache-dir", default=os.environ.get("OUTLINE_CACHE_DIR"),
+                        help="Directory for the persistent outline/page-text cache (disabled if unset).")
+    parser.add_argument("--cache-max-mb", type=int, default=512,
+                        help="Size bound of the outline cache in MB (default 512).")
+    parser.add_argument("--query-cache-dir", default=os.environ.get("QUERY_CACHE_DIR"),
+                        help="Directory for the persistent whole-query result cache (disabled if unset).")
+    parser.add_argument("--query-cache-entries", type=int, default=1000,
+                        help="Most query results kept; least recently used go first (default 1000).")
+    parser.add_argument("--query-cache-ttl-hours", type=float, default=168,
+                        help="Drop query results unused for this long (default 168 = one week).")
+    parser.add_argument("--timings", action="store_true",
+                        help="Add a metadata.performance block (per document and per case) to every output.")
+    parser.add_argument("--profile-dir",
+                        help="Save a cProfile dump per document under this directory (implies --timings).")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Record the tracemalloc peak of every document (implies --timings).")
+    parser.add_argument("--prometheus",
+                        help="Also export the timings to this Prometheus text file (implies --timings).")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    cache = OutlineCache(args.cache_dir, args.cache_max_mb * 1024 * 1024, MODEL_DIR) if args.cache_dir else None
+    instrument = None
+    if args.timings or args.profile_dir or args.trace_memory or args.prometheus:
+        instrument = Instrumentation(args.profile_dir, args.trace_memory)
+    query_cache = None
+    if args.query_cache_dir:
+        query_cache = open_query_cache(args.query_cache_dir, args.query_cache_entries, args.query_cache_ttl_hours * 3600)
+    run(workers=args.workers or os.cpu_count(), cache=cache, instrument=instrument, shard_pages=args.shard_pages,
+        prefetch=args.prefetch, prefetch_max_mb=args.prefetch_mb, query_cache=query_cache)
+    if args.prometheus:
+        write_prometheus(args.prometheus, instrument.cases)
@@ -1,62 +1,90 @@
 # pipeline.py
 
-import subprocess
-import shutil
-
-def run(_, command):
-    result = subprocess.run(command, shell=True)
-    if result.returncode != 0:
-        exit(1)
-
-# STEP 1 — Training & First Output with base model
-run("prep", "python prepare_subsection_training.py")
-run("train_base", "python train_subsummarizer.py")
-
-# Ensure subsummarizer.py uses base model
-with open("subsummarizer.py", "w") as f:
-    f.write('''import joblib
-from sklearn.metrics.pairwise import cosine_similarity
-
-model = joblib.load("sub_summarizer.joblib")
-vectorizer = model["vectorizer"]
-matrix = model["matrix"]
-summaries = model["summaries"]
-
-def predict_summary(paragraph: str) -> str:
-    if not paragraph.strip():
-        return ""
-    vec = vectorizer.transform([paragraph])
-    sim = cosine_similarity(vec, matrix)
-    best_idx = sim.argmax()
-    return summaries[best_idx]
-''')
-
-# Run with base summarizer
-run("main1", "python main.py")
-
-# STEP 2 — Pseudo-labeling + Retraining + Final Output
-run("pseudo", "python compare_predictions.py")
-run("retrain", "python retrain_summarizer.py")
-
-# Swap summarizer to use retrained model
-with open("subsummarizer.py", "w") as f:
-    f.write('''import joblib
-from sklearn.metrics.pairwise import cosine_similarity
-
-model = joblib.load("sub_summarizer_retrained.joblib")
-vectorizer = model["vectorizer"]
-matrix = model["matrix"]
-summaries = model["summaries"]
-
-def predict_summary(paragraph: str) -> str:
-    if not paragraph.strip():
-        return ""
-    vec = vectorizer.transform([paragraph])
-    sim = cosine_similarity(vec, matrix)
-    best_idx = sim.argmax()
-    return summaries[best_idx]
-''')
-
-# Final output using retrained summarizer
-run("main2", "python main.py")
-print("Output saved!")
+import argparse
+import os
+import joblib
+import pandas as pd
+import main
+import subsummarizer
+from compare_predictions import mine_pseudo_labels, OUT_CSV as PSEUDO_CSV
+from doc_cache import MODEL_FILES, OutlineCache
+from flat_model import classifier_dir, is_current, save_classifier, save_summarizer
+from prepare_subsection_training import build_training_rows, OUT_CSV as TRAIN_CSV
+from retrain_summarizer import append_pairs, load_incremental, retrain, MODEL_PATH as RETRAINED_PATH
+from summary_index import MAX_QUERY_TERMS, SummaryIndex, build_index, index_path
+from train_subsummarizer import train_base, MODEL_PATH as BASE_PATH
+
+def export_classifier(model_dir=main.MODEL_DIR):
+    """Writes the heading classifier's flat export, unless a current one is already there."""
+    if not is_current(classifier_dir(model_dir), *(model_dir / name for name in MODEL_FILES)):
+        print(f"Heading classifier exported to {save_classifier(model_dir)}")
+
+def serve_summarizer(model, path, save_artifacts, max_query_terms=MAX_QUERY_TERMS):
+    """Switches subsummarizer to a freshly trained model, saving it if asked."""
+    if save_artifacts:
+        joblib.dump(model, path)
+        index = build_index(model, path, max_query_terms)
+        save_summarizer(model, path, index)
+    else:
+        index = SummaryIndex(model["matrix"], max_query_terms)
+    subsummarizer.use_model(model, index)
+
+def run_pipeline(workers=1, cache=None, save_artifacts=True, incremental=False, max_query_terms=MAX_QUERY_TERMS):
+    """Runs prep -> train -> infer -> pseudo-label -> retrain -> infer in one process.
+
+    Training pairs, fitted models and outputs are handed between stages in
+    memory, and PDFs are analyzed once: the second inference pass only re-ranks
+    and re-summarizes. With `save_artifacts`, the CSVs and joblib models are
+    still written so the stages can be rerun as standalone scripts, and the
+    heading classifier gets its flat export. With
+    `incremental`, the retrained summarizer is extended with the new pairs
+    instead of being refitted. `max_query_terms` caps the queries of refitted
+    summarizers' indexes (see build_index).
+    """
+    if save_artifacts:
+        export_classifier()
+
+    # STEP 1 — Training & First Output with base model
+    df_true = build_training_rows()
+    serve_summarizer(train_base(df_true), BASE_PATH, save_artifacts, max_query_terms)
+
+    cases = list(main.analyze_cases(workers, cache))
+    outputs = main.run(cases=cases)
+
+    # STEP 2 — Pseudo-labeling + Retraining + Final Output
+    df_pseudo = mine_pseudo_labels(outputs, workers=workers)
+    if incremental:
+        model, index = load_incremental(RETRAINED_PATH)
+        index = append_pairs(model, pd.concat([df_true, df_pseudo], ignore_index=True), index)
+        if save_artifacts:
+            joblib.dump(model, RETRAINED_PATH)
+            index.save(index_path(RETRAINED_PATH))
+            save_summarizer(model, RETRAINED_PATH, index)
+        subsummarizer.use_model(model, index)
+    else:
+        serve_summarizer(retrain(df_true, df_pseudo), RETRAINED_PATH, save_artifacts, max_query_terms)
+
+    if save_artifacts:
+        df_true.to_csv(TRAIN_CSV, index=False)
+        df_pseudo.to_csv(PSEUDO_CSV, index=False)
+
+    return main.run(cases=cases)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train, pseudo-label, retrain and run the ranking pipeline.")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", "1")),
+                        help="Worker processes for PDF analysis (0 = one per CPU, default 1 = serial).")
+    parser.add_argument("--cache-dir", default=os.environ.get("OUTLINE_CACHE_DIR"),
+                        help="Directory for the persistent outline/page-text cache (disabled if unset).")
+    parser.add_argument("--no-save", action="store_true", help="Keep models and training CSVs in memory only.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Append new pairs to the saved hashing-vectorizer summarizer instead of refitting.")
+    parser.add_argument("--max-query-terms", type=int, default=MAX_QUERY_TERMS,
+                        help="Prune index queries to their N heaviest terms: faster but approximate; prints "
+                             "the recall@1 against exact search (default: exact search). Refitted summarizers only.")
+    args = parser.parse_args()
+
+    cache = OutlineCache(args.cache_dir, model_dir=main.MODEL_DIR) if args.cache_dir else None
+    run_pipeline(args.workers or os.cpu_count(), cache, save_artifacts=not args.no_save, incremental=args.incremental,
+                 max_query_terms=args.max_query_terms)
+    print("Output saved!")
@@ -0,0 +1,100 @@
+# prefetch.py
+
+import os
+import threading
+import time
+from collections import deque
+
+# Documents read ahead of the one being analyzed, and the bytes they may hold.
+PREFETCH_DEPTH = 2
+PREFETCH_MAX_MB = 256
+
+class PrefetchedFile:
+    """One PDF read into memory: its bytes (or the error reading it) and the I/O time spent."""
+
+    __slots__ = ("path", "data", "error", "read_seconds", "wait_seconds")
+
+    def __init__(self, path, data, error, read_seconds):
+        self.path = path
+        self.data = data
+        self.error = error
+        self.read_seconds = read_seconds
+        self.wait_seconds = 0.0
+
+class PdfPrefetcher:
+    """Background thread that reads upcoming PDFs into memory while the current one is analyzed.
+
+    Files are read in input order into at most `depth` buffers holding at most
+    `max_bytes` together; a file bigger than that is still read, once the
+    buffers are empty. Iterating yields one PrefetchedFile per path, in order,
+    and re-raises a read error when its file is reached. Each file carries its
+    read and wait times; `peak_buffered` is the most bytes held at once.
+    """
+
+    def __init__(self, pdf_paths, depth=PREFETCH_DEPTH, max_bytes=PREFETCH_MAX_MB * 1024 * 1024):
+        self.pdf_paths = list(pdf_paths)
+        self.depth = max(depth, 1)
+        self.max_bytes = max_bytes
+        self.ready = deque()
+        self.buffered = 0
+        self.peak_buffered = 0
+        self.closed = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._read_all, name="pdf-prefetch", daemon=True)
+        self.thread.start()
+
+    def _read_all(self):
+        for path in self.pdf_paths:
+            try:
+                size = os.stat(path).st_size
+            except OSError:
+                size = 0
+            with self.cond:
+                while not self.closed and self.ready and (
+                        len(self.ready) >= self.depth or self.buffered + size > self.max_bytes):
+                    self.cond.wait()
+                if self.closed:
+                    return
+
+            start = time.perf_counter()
+            data = error = None
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError as e:
+                error = e
+            item = PrefetchedFile(path, data, error, time.perf_counter() - start)
+
+            with self.cond:
+                self.ready.append(item)
+                self.buffered += len(data or b"")
+                self.peak_buffered = max(self.peak_buffered, self.buffered)
+                self.cond.notify_all()
+
+    def __iter__(self):
+        for _ in self.pdf_paths:
+            start = time.perf_counter()
+            with self.cond:
+                while not self.ready:
+                    self.cond.wait()
+                item = self.ready.popleft()
+                self.buffered -= len(item.data or b"")
+                self.cond.notify_all()
+            item.wait_seconds = time.perf_counter() - start
+            if item.error is not None:
+                raise item.error
+            yield item
+
+    def close(self):
+        """Stops the reader after its current file and drops the buffers."""
+        with self.cond:
+            self.closed = True
+            self.ready.clear()
+            self.buffered = 0
+            self.cond.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,166 @@
+# prefilter.py
+
+import json
+import re
+from collections import Counter
+
+import numpy as np
+
+# Longest line, in characters and words, that is still sent to the classifier.
+MAX_CHARS = 60
+MAX_WORDS = 12
+# Lines this far below the body font size are dropped unless bold.
+SMALL_FONT_MARGIN = 1.0
+# Top/bottom share of the page where running headers and footers live.
+EDGE_BAND = 0.07
+MIN_REPEAT_PAGES = 3
+
+PAGE_NUMBER_RE = re.compile(r"^(page\s*)?[\d\s./-]+$", re.I)
+
+def layout_stats(layout):
+    """Document-wide inputs of the prefilter, for all pages or for one page range.
+
+    Returns (characters per font size rounded to 0.1pt, number of pages each
+    top/bottom-band text is on, number of pages). Stats of page ranges add up
+    with `merge_stats` to those of the whole document.
+    """
+    size_chars = Counter()
+    edge_texts = Counter()
+    for page in layout:
+        lengths = np.fromiter(map(len, page.texts), dtype=np.float64, count=len(page.texts))
+        values, inverse = np.unique(np.round(page.sizes, 1), return_inverse=True)
+        size_chars.update(dict(zip(values.tolist(), np.bincount(inverse, weights=lengths, minlength=len(values)).tolist())))
+        nonempty = np.diff(page.line_starts) > 0
+        starts = page.line_starts[:-1][nonempty]
+        ends = page.line_starts[1:][nonempty]
+        y = page.bboxes[starts, 1] / (page.height or 1.0)
+        edge = (y < EDGE_BAND) | (y > 1 - EDGE_BAND)
+        edge_texts.update({page.line_text(start, end, " ").strip().lower()
+                           for start, end in zip(starts[edge].tolist(), ends[edge].tolist())})
+    return size_chars, edge_texts, len(layout)
+
+def merge_stats(parts):
+    """Adds up `layout_stats` of consecutive page ranges."""
+    size_chars, edge_texts, n_pages = Counter(), Counter(), 0
+    for part_sizes, part_edges, part_pages in parts:
+        size_chars.update(part_sizes)
+        edge_texts.update(part_edges)
+        n_pages += part_pages
+    return size_chars, edge_texts, n_pages
+
+class LinePrefilter:
+    """Cheap per-document rules that rule out lines which cannot be headings.
+
+    Built from a document's layout, it knows the body font size (the most
+    common size, weighted by characters) and the running headers/footers
+    (texts in the top or bottom band repeated on many pages). `keep` then drops
+    long lines, page numbers, running headers/footers and small non-bold text
+    before any feature is built or the classifier is run.
+    """
+
+    def __init__(self, layout, max_chars=MAX_CHARS, max_words=MAX_WORDS):
+        self._init(layout_stats(layout), max_chars, max_words)
+
+    @classmethod
+    def from_stats(cls, stats=None, max_chars=MAX_CHARS, max_words=MAX_WORDS):
+        """Builds the prefilter from (merged) `layout_stats`; without stats only the per-line rules apply."""
+        prefilter = cls.__new__(cls)
+        prefilter._init(stats or (Counter(), Counter(), 0), max_chars, max_words)
+        return prefilter
+
+    def _init(self, stats, max_chars, max_words):
+        self.max_chars = max_chars
+        self.max_words = max_words
+        size_chars, edge_texts, n_pages = stats
+        # Ties go to the smallest size.
+        self.body_size = max(sorted(size_chars), key=size_chars.__getitem__) if size_chars else 0.0
+        min_repeats = max(MIN_REPEAT_PAGES, n_pages // 2)
+        self.running = {text for text, n in edge_texts.items() if n >= min_repeats}
+
+    def keep_line(self, text):
+        """The rules that need nothing but the line's own text."""
+        return (len(text) <= self.max_chars and len(text.split()) <= self.max_words
+                and not PAGE_NUMBER_RE.match(text))
+
+    def keep(self, text, size, is_bold, y_ratio):
+        if not self.keep_line(text):
+            return False
+        if not is_bold and size < self.body_size - SMALL_FONT_MARGIN:
+            return False
+        if (y_ratio < EDGE_BAND or y_ratio > 1 - EDGE_BAND) and text.lower() in self.running:
+            return False
+        return True
+
+class DeferredPrefilter(LinePrefilter):
+    """Prefilter for one page range of a document whose other pages are not known yet.
+
+    `keep` applies only the per-line rules and records, for every kept row,
+    what the document-wide rules need. Once all page ranges are merged, rows
+    are re-checked with a full LinePrefilter built from the merged stats.
+    """
+
+    def __init__(self, max_chars=MAX_CHARS, max_words=MAX_WORDS):
+        self._init((Counter(), Counter(), 0), max_chars, max_words)
+        self.rows = []
+
+    def keep(self, text, size, is_bold, y_ratio):
+        if not self.keep_line(text):
+            return False
+        self.rows.append((size, is_bold, y_ratio))
+        return True
+
+def _squash(text):
+    return re.sub(r"\s+", " ", text.strip()).lower()
+
+def evaluate(input_root="input", label_root="labels", max_chars=MAX_CHARS, max_words=MAX_WORDS):
+    """Compares the prefiltered and unfiltered heading paths on every labeled case.
+
+    Reports the rows sent to the classifier, the share of unfiltered model
+    headings the prefilter keeps (precision against the unfiltered path is 1 by
+    construction, since kept rows get the same prediction), and the recall of
+    the labeled section titles in the merged outline, with and without it.
+    """
+    import fitz
+    import main
+    from features import build_features
+    from fallback_utils import extract_headings_structured
+    from layout import extract_layout
+    from pathlib import Path
+
+    main.load_models()
+    totals = Counter()
+    for label_file in sorted(Path(label_root).glob("*.json")):
+        case_dir = Path(input_root) / label_file.stem
+        with open(label_file, encoding="utf-8") as f:
+            wanted = {(s["document"], _squash(s["section_title"])) for s in json.load(f)["extracted_sections"]}
+        found = {False: set(), True: set()}
+        rows = {False: 0, True: 0}
+        model_heads = {False: set(), True: set()}
+
+        for pdf_path in sorted(case_dir.glob("*.pdf")):
+            layout = extract_layout(fitz.open(pdf_path))
+            rule = extract_headings_structured(layout)
+            for filtered in (False, True):
+                prefilter = LinePrefilter(layout, max_chars, max_words) if filtered else None
+                X, texts, pages = build_features(layout, main.font_lookup, main.punct_lookup, prefilter)
+                outline_model = main.classify_lines(X, texts, pages)
+                rows[filtered] += len(texts)
+                model_heads[filtered].update((pdf_path.name, h.page, h.text) for h in outline_model)
+                found[filtered].update((pdf_path.name, _squash(h.text))
+                                       for h in main.merge_outlines(outline_model, rule))
+
+        kept = len(model_heads[True] & model_heads[False]) / max(len(model_heads[False]), 1)
+        print(f"{case_dir.name}: rows {rows[False]} -> {rows[True]} ({rows[False] / max(rows[True], 1):.1f}x fewer), "
+              f"model headings kept {kept:.3f}, label recall "
+              f"{len(wanted & found[False]) / max(len(wanted), 1):.3f} -> {len(wanted & found[True]) / max(len(wanted), 1):.3f}")
+        totals["rows"] += rows[False]
+        totals["rows_filtered"] += rows[True]
+    print(f"all cases: rows {totals['rows']} -> {totals['rows_filtered']}")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Precision/recall of the heading prefilter on the labeled cases.")
+    parser.add_argument("--max-chars", type=int, default=MAX_CHARS)
+    parser.add_argument("--max-words", type=int, default=MAX_WORDS)
+    args = parser.parse_args()
+    evaluate(max_chars=args.max_chars, max_words=args.max_words)
@@ -0,0 +1,180 @@
+import re
+import numpy as np
+from scipy.sparse import csr_matrix
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "for", "from", "how",
+    "i", "in", "into", "is", "it", "its", "my", "of", "on", "or", "our", "so",
+    "that", "the", "their", "them", "this", "to", "up", "was", "we", "what",
+    "when", "which", "who", "will", "with", "you", "your",
+}
+
+def tokenize(text):
+    """Lowercases, splits on non-alphanumerics, drops stopwords and folds simple plurals."""
+    tokens = []
+    for tok in TOKEN_RE.findall(text.lower()):
+        if tok in STOPWORDS:
+            continue
+        if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"):
+            tok = tok[:-1]
+        tokens.append(tok)
+    return tokens
+
+def section_counts(title, body="", title_weight=2):
+    """Term counts of one section: its heading `title_weight` times, plus its body."""
+    counts = {}
+    for tok in tokenize(title):
+        counts[tok] = counts.get(tok, 0) + title_weight
+    for tok in tokenize(body):
+        counts[tok] = counts.get(tok, 0) + 1
+    return counts
+
+def _bm25(idf, avgdl, rows, cols, tfs, lengths, k1, b):
+    """BM25 term weights for (row, col, tf) triples of sections with the given lengths."""
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    tf = np.asarray(tfs, dtype=np.float64)
+    lengths = np.asarray(lengths, dtype=np.float64)
+    norm = k1 * (1 - b + b * lengths[rows] / max(avgdl, 1e-9))
+    data = idf[cols] * tf * (k1 + 1) / (tf + norm)
+    return csr_matrix((data, (rows, cols)), shape=(len(lengths), len(idf)))
+
+def _query_vector(vocab, query):
+    q = np.zeros(len(vocab))
+    for tok in set(tokenize(query)):
+        col = vocab.get(tok)
+        if col is not None:
+            q[col] = 1.0
+    return q
+
+def _squash(text):
+    return re.sub(r"\s+", "", text).lower()
+
+def section_bodies(outline, pages, max_lines=30):
+    """Finds the body text under each outline heading.
+
+    The body is the run of page lines after the heading's own line, up to the
+    next heading found on the same page (at most `max_lines` lines). Headings
+    that cannot be located on their page get an empty body.
+    """
+    by_page = {}
+    for i, item in enumerate(outline):
+        by_page.setdefault(item.page, []).append(i)
+
+    bodies = [""] * len(outline)
+    for page_no, idxs in by_page.items():
+        if page_no >= len(pages):
+            continue
+        lines = [l.strip() for l in pages[page_no].split("\n") if l.strip()]
+        squashed = [_squash(l) for l in lines]
+
+        starts = {}
+        for i in idxs:
+            key = _squash(outline[i].text)
+            for pos, line in enumerate(squashed):
+                if key and line.startswith(key):
+                    starts[i] = pos
+                    break
+
+        positions = sorted(set(starts.values()))
+        for i, pos in starts.items():
+            nxt = next((p for p in positions if p > pos), len(lines))
+            bodies[i] = " ".join(lines[pos + 1:min(nxt, pos + 1 + max_lines)])
+    return bodies
+
+class SectionIndex:
+    """BM25 inverted index over the sections of a whole document collection.
+
+    Each section is indexed once from its heading (counted `title_weight` times)
+    and its body. Term weights are stored in a sparse section x term matrix, so
+    scoring a query is one sparse matrix-vector product over its terms.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, title_weight=2):
+        self.k1 = k1
+        self.b = b
+        self.title_weight = title_weight
+        self.vocab = {}
+        self.rows, self.cols, self.tfs = [], [], []
+        self.lengths = []
+        self.weights = None
+
+    def add(self, title, body=""):
+        """Adds one section and returns its row id."""
+        row = len(self.lengths)
+        counts = section_counts(title, body, self.title_weight)
+        for tok, tf in counts.items():
+            self.rows.append(row)
+            self.cols.append(self.vocab.setdefault(tok, len(self.vocab)))
+            self.tfs.append(tf)
+        self.lengths.append(sum(counts.values()))
+        self.weights = None
+        return row
+
+    def build(self):
+        n = len(self.lengths)
+        df = np.bincount(np.asarray(self.cols, dtype=np.int64), minlength=len(self.vocab))
+        idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5))
+        avgdl = np.asarray(self.lengths, dtype=np.float64).mean() if n else 0.0
+        self.weights = _bm25(idf, avgdl, self.rows, self.cols, self.tfs, self.lengths, self.k1, self.b)
+        return self
+
+    def score(self, query):
+        """Returns the BM25 score of every section for a free-text query."""
+        if self.weights is None:
+            self.build()
+        return self.weights @ _query_vector(self.vocab, query)
+
+class SectionStats:
+    """Collection-wide BM25 statistics, for scoring a collection one document at a time.
+
+    `add` every section once, in collection order, to collect the vocabulary,
+    document frequencies and section lengths; `score` then takes one
+    document's sections at a time. Scores are bit-identical to SectionIndex's
+    over the whole collection, but only the vocabulary and one length per
+    section are kept, not the section x term matrix.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, title_weight=2):
+        self.k1 = k1
+        self.b = b
+        self.title_weight = title_weight
+        self.vocab = {}
+        self.df = []
+        self.lengths = []
+        self.idf = None
+        self.avgdl = 0.0
+
+    def add(self, title, body=""):
+        counts = section_counts(title, body, self.title_weight)
+        for tok in counts:
+            col = self.vocab.setdefault(tok, len(self.vocab))
+            if col == len(self.df):
+                self.df.append(0)
+            self.df[col] += 1
+        self.lengths.append(sum(counts.values()))
+        self.idf = None
+
+    def build(self):
+        n = len(self.lengths)
+        df = np.asarray(self.df, dtype=np.int64)
+        self.idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5))
+        self.avgdl = np.asarray(self.lengths, dtype=np.float64).mean() if n else 0.0
+        return self
+
+    def score(self, sections, query):
+        """BM25 scores of (title, body) sections already added, for a free-text query."""
+        if self.idf is None:
+            self.build()
+        rows, cols, tfs, lengths = [], [], [], []
+        for row, (title, body) in enumerate(sections):
+            counts = section_counts(title, body, self.title_weight)
+            for tok, tf in counts.items():
+                rows.append(row)
+                cols.append(self.vocab[tok])
+                tfs.append(tf)
+            lengths.append(sum(counts.values()))
+        weights = _bm25(self.idf, self.avgdl, rows, cols, tfs, lengths, self.k1, self.b)
+        return weights @ _query_vector(self.vocab, query)
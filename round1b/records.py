@@ -0,0 +1,65 @@
+class StringPool:
+    """Interns repeated strings (font names, running headers) within one document."""
+
+    __slots__ = ("strings",)
+
+    def __init__(self):
+        self.strings = {}
+
+    def __call__(self, s):
+        return self.strings.setdefault(s, s)
+
+class PageLayout:
+    """Columnar span table of one page.
+
+    Span attributes live in parallel arrays (`texts`, `fonts`, `sizes`,
+    `bboxes` as x0, y0, x1, y1 rows), and the spans of line i are rows
+    `line_starts[i]:line_starts[i + 1]`. Lines without spans are kept as empty
+    ranges so the page text still has one line per PyMuPDF line.
+    """
+
+    __slots__ = ("height", "texts", "fonts", "sizes", "bboxes", "line_starts")
+
+    def __init__(self, height, texts, fonts, sizes, bboxes, line_starts):
+        self.height = height
+        self.texts = texts
+        self.fonts = fonts
+        self.sizes = sizes
+        self.bboxes = bboxes
+        self.line_starts = line_starts
+
+    def line_ranges(self):
+        """Yields (start, end) span rows for every line, including empty ones."""
+        starts = self.line_starts.tolist()
+        return zip(starts[:-1], starts[1:])
+
+    def line_text(self, start, end, sep=""):
+        return sep.join(self.texts[start:end])
+
+    def text(self):
+        """Plain text of the page, matching `page.get_text("text")`."""
+        return "".join(self.line_text(s, e) + "\n" for s, e in self.line_ranges())
+
+class OutlineEntry:
+    """One heading of a document outline."""
+
+    __slots__ = ("level", "text", "page")
+
+    def __init__(self, level, text, page):
+        self.level = level
+        self.text = text
+        self.page = page
+
+    def __eq__(self, other):
+        return (isinstance(other, OutlineEntry)
+                and (self.level, self.text, self.page) == (other.level, other.text, other.page))
+
+    def __repr__(self):
+        return f"OutlineEntry({self.level!r}, {self.text!r}, {self.page!r})"
+
+    def to_dict(self):
+        return {"level": self.level, "text": self.text, "page": self.page}
+
+    @classmethod
+    def from_dict(cls, item):
+        return cls(item["level"], item["text"], item["page"])
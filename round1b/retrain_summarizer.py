@@ -1,29 +1,129 @@
+import argparse
+import os
 import pandas as pd
 import joblib
-from sklearn.feature_extraction.text import TfidfVectorizer
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from flat_model import save_summarizer
+from summary_index import MAX_QUERY_TERMS, SummaryIndex, build_index, index_path
 
-df_true = pd.read_csv("subsection_training.csv")
-df_pseudo = pd.read_csv("pseudo_training.csv")
+MODEL_PATH = "sub_summarizer_retrained.joblib"
 
-df = pd.concat([df_true, df_pseudo], ignore_index=True)
-df.drop_duplicates(subset=["paragraph", "refined_text"], inplace=True)
+# Summaries seen more often than this are dropped as too generic.
+MAX_SUMMARY_COUNT = 10
 
-# Remove overly frequent summaries
-counts = df["refined_text"].value_counts()
-common = counts[counts > 10].index.tolist()
-df = df[~df["refined_text"].isin(common)]
+# Incremental mode: stateless hashing features and how many appended index segments to allow.
+HASH_FEATURES = 2 ** 18
+MAX_INDEX_SEGMENTS = 8
 
-paragraphs = df["paragraph"].astype(str).tolist()
-summaries = df["refined_text"].astype(str).tolist()
+def retrain(df_true, df_pseudo):
+    """Refits the word TF-IDF summarizer on true plus pseudo-labelled pairs."""
+    df = pd.concat([df_true, df_pseudo], ignore_index=True)
+    df.drop_duplicates(subset=["paragraph", "refined_text"], inplace=True)
 
-vectorizer = TfidfVectorizer(max_features=1000)
-X = vectorizer.fit_transform(paragraphs)
+    # Remove overly frequent summaries
+    counts = df["refined_text"].value_counts()
+    common = counts[counts > MAX_SUMMARY_COUNT].index.tolist()
+    df = df[~df["refined_text"].isin(common)]
 
-model = {
-    "vectorizer": vectorizer,
-    "paragraphs": paragraphs,
-    "summaries": summaries,
-    "matrix": X
-}
+    paragraphs = df["paragraph"].astype(str).tolist()
+    summaries = df["refined_text"].astype(str).tolist()
 
-joblib.dump(model, "sub_summarizer_retrained.joblib")
+    vectorizer = TfidfVectorizer(max_features=1000)
+    X = vectorizer.fit_transform(paragraphs)
+
+    return {
+        "vectorizer": vectorizer,
+        "paragraphs": paragraphs,
+        "summaries": summaries,
+        "matrix": X
+    }
+
+def new_incremental_model():
+    """An empty summarizer whose vectorizer never needs refitting."""
+    return {
+        "vectorizer": HashingVectorizer(n_features=HASH_FEATURES, alternate_sign=False, norm="l2"),
+        "paragraphs": [],
+        "summaries": [],
+        "matrix": csr_matrix((0, HASH_FEATURES)),
+        "summary_counts": {},
+        "seen_pairs": set(),
+        "incremental": True
+    }
+
+def append_pairs(model, df, index=None):
+    """Adds new paragraph/summary pairs to an incremental model in place.
+
+    Duplicate pairs are skipped and the `counts > MAX_SUMMARY_COUNT` filter is
+    kept with running per-summary counts, so the stored rows always equal what
+    `retrain` would keep on all pairs seen so far. Only the new paragraphs are
+    vectorized. They are appended to the matrix and, as a new segment, to the
+    index. The index is rebuilt only when a summary crosses the frequency limit
+    and its older rows have to go. Returns the (possibly new) index.
+    """
+    seen, counts = model["seen_pairs"], model["summary_counts"]
+    new_paragraphs, new_summaries = [], []
+    for paragraph, summary in zip(df["paragraph"], df["refined_text"]):
+        if (paragraph, summary) in seen:
+            continue
+        seen.add((paragraph, summary))
+        counts[summary] = counts.get(summary, 0) + 1
+        new_paragraphs.append(str(paragraph))
+        new_summaries.append(str(summary))
+
+    common = {s for s in set(new_summaries) if counts[s] > MAX_SUMMARY_COUNT}
+    keep = [s not in common for s in model["summaries"]]
+    rebuild = index is None or not all(keep)
+    if not all(keep):
+        model["matrix"] = model["matrix"][keep]
+        model["paragraphs"] = [p for p, k in zip(model["paragraphs"], keep) if k]
+        model["summaries"] = [s for s, k in zip(model["summaries"], keep) if k]
+
+    fresh = [(p, s) for p, s in zip(new_paragraphs, new_summaries) if s not in common]
+    if fresh:
+        X_new = model["vectorizer"].transform([p for p, _ in fresh])
+        model["matrix"] = vstack([model["matrix"], X_new], format="csr")
+        model["paragraphs"].extend(p for p, _ in fresh)
+        model["summaries"].extend(s for _, s in fresh)
+
+    if rebuild:
+        return SummaryIndex(model["matrix"])
+    if fresh:
+        index.append(X_new)
+        if len(index.segments) > MAX_INDEX_SEGMENTS:
+            index.compact()
+    return index
+
+def load_incremental(path=MODEL_PATH):
+    """Loads a saved incremental model and its index, or starts a new one."""
+    if os.path.exists(path):
+        model = joblib.load(path)
+        if model.get("incremental"):
+            index = joblib.load(index_path(path)) if os.path.exists(index_path(path)) else None
+            return model, index
+    return new_incremental_model(), None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrain the summarizer on true + pseudo-labelled pairs.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Append new pairs to the saved hashing-vectorizer model instead of refitting.")
+    parser.add_argument("--max-query-terms", type=int, default=MAX_QUERY_TERMS,
+                        help="Prune index queries to their N heaviest terms: faster but approximate; prints "
+                             "the recall@1 against exact search (default: exact search). Refits only.")
+    args = parser.parse_args()
+
+    df_true = pd.read_csv("subsection_training.csv")
+    df_pseudo = pd.read_csv("pseudo_training.csv")
+
+    if args.incremental:
+        model, index = load_incremental(MODEL_PATH)
+        before = len(model["summaries"])
+        index = append_pairs(model, pd.concat([df_true, df_pseudo], ignore_index=True), index)
+        joblib.dump(model, MODEL_PATH)
+        index.save(index_path(MODEL_PATH))
+        save_summarizer(model, MODEL_PATH, index)
+        print(f"Incremental retrain: {before} -> {len(model['summaries'])} rows, {len(index.segments)} index segments")
+    else:
+        model = retrain(df_true, df_pseudo)
+        joblib.dump(model, MODEL_PATH)
+        save_summarizer(model, MODEL_PATH, build_index(model, MODEL_PATH, args.max_query_terms))
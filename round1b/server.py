@@ -0,0 +1,176 @@
+# server.py
+
+import argparse
+import json
+import os
+import socketserver
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import main
+import subsummarizer
+from doc_cache import OutlineCache
+from instrumentation import Instrumentation
+
+class RankingService:
+    """Keeps the heading models and summarizer warm and answers ranking queries.
+
+    PyMuPDF is not safe to share between threads, so without a worker pool
+    requests are analyzed one at a time under a lock. With a pool, each request
+    fans its PDFs out to worker processes that loaded the models once at
+    startup, and concurrent requests run side by side. Their ranking and
+    summarization still run in this process's threads; that is safe because
+    the summarizer, loaded here before any request, is only read: its
+    vectorizer transform and index lookups never modify shared state.
+    With `timings`, every response carries a `metadata.performance` block.
+    With a QueryCache, a repeated query is answered from it and `GET /stats`
+    reports its counters.
+    Both caches are keyed on the models loaded here (pool workers fork from
+    this process), so serving retrained models takes a restart.
+    """
+
+    def __init__(self, workers=1, cache=None, timings=False, query_cache=None):
+        caches = [c for c in (cache, query_cache) if c is not None]
+        versions = [c.models() for c in caches]
+        main.load_models()
+        subsummarizer.load_model()
+        if [c.pin_models() for c in caches] != versions:
+            raise RuntimeError("models changed on disk while the service was loading them")
+        self.cache = cache
+        self.timings = timings
+        self.query_cache = query_cache
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=main.load_models) if workers > 1 else None
+        self.lock = threading.Lock()
+
+    def rank(self, payload):
+        """Returns the output JSON for a challenge1b_input.json payload.
+
+        PDFs are taken from `document_paths`, or from the payload's `documents`
+        filenames resolved against `documents_dir`. They are processed in sorted
+        filename order, as main.py does for a case directory.
+        """
+        meta = payload.get("input", payload)
+        persona, job = main.parse_query(meta)
+
+        if payload.get("document_paths"):
+            pdf_paths = [Path(p) for p in payload["document_paths"]]
+        elif payload.get("documents_dir"):
+            root = Path(payload["documents_dir"])
+            pdf_paths = [root / d["filename"] for d in meta.get("documents", [])] or list(root.glob("*.pdf"))
+        else:
+            raise ValueError("payload needs 'document_paths' or 'documents_dir'")
+
+        missing = [str(p) for p in pdf_paths if not p.is_file()]
+        if missing:
+            raise ValueError(f"documents not found: {', '.join(missing)}")
+        pdf_paths = sorted(pdf_paths, key=lambda p: p.name)
+
+        instrument = Instrumentation() if self.timings else None
+        key = None
+        if self.query_cache is not None:
+            # Hits never wait for the lock; only a miss needs the models.
+            key, out_json = main.lookup_query(self.query_cache, persona, job, pdf_paths, instrument)
+            if out_json is not None:
+                return out_json
+        if self.pool is not None:
+            return main.rank_collection(pdf_paths, persona, job, self.cache, self.pool, instrument,
+                                        query_cache=self.query_cache, query_key=key)
+        with self.lock:
+            return main.rank_collection(pdf_paths, persona, job, self.cache, instrument=instrument,
+                                        query_cache=self.query_cache, query_key=key)
+
+    def stats(self):
+        return {"query_cache": self.query_cache.stats() if self.query_cache is not None else None}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+class RankingHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def address_string(self):
+        # Unix socket peers have no (host, port) pair.
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok"})
+        elif self.path == "/stats":
+            self.send_json(200, self.service.stats())
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/rank":
+            self.send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            result = self.service.rank(payload)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+            return
+        self.send_json(200, result)
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = "localhost", 0
+
+def serve(service, host="127.0.0.1", port=8080, socket_path=None):
+    RankingHandler.service = service
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        httpd = ThreadingUnixHTTPServer(socket_path, RankingHandler)
+        print(f"Serving on unix:{socket_path}")
+    else:
+        httpd = ThreadingHTTPServer((host, port), RankingHandler)
+        print(f"Serving on http://{host}:{port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-running ranking service: POST /rank with a challenge1b_input.json payload.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--socket", help="Listen on this Unix socket instead of TCP.")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for PDF analysis (default 1 = in-process).")
+    parser.add_argument("--cache-dir", default=os.environ.get("OUTLINE_CACHE_DIR"),
+                        help="Directory for the persistent outline/page-text cache (disabled if unset).")
+    parser.add_argument("--cache-max-mb", type=int, default=512)
+    parser.add_argument("--query-cache-dir", default=os.environ.get("QUERY_CACHE_DIR"),
+                        help="Directory for the persistent whole-query result cache (disabled if unset).")
+    parser.add_argument("--query-cache-entries", type=int, default=1000)
+    parser.add_argument("--query-cache-ttl-hours", type=float, default=168)
+    parser.add_argument("--timings", action="store_true", help="Add a metadata.performance block to every response.")
+    args = parser.parse_args()
+
+    cache = OutlineCache(args.cache_dir, args.cache_max_mb * 1024 * 1024, main.MODEL_DIR) if args.cache_dir else None
+    query_cache = None
+    if args.query_cache_dir:
+        query_cache = main.open_query_cache(args.query_cache_dir, args.query_cache_entries,
+                                            args.query_cache_ttl_hours * 3600)
+    serve(RankingService(args.workers, cache, args.timings, query_cache), args.host, args.port, args.socket)
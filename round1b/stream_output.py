@@ -0,0 +1,216 @@
+# stream_output.py
+
+import argparse
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import main
+from doc_cache import OutlineCache, file_digest, model_version
+from instrumentation import NULL_TIMINGS, Instrumentation, Timings, write_prometheus
+from ranking import SectionStats, section_bodies
+from records import OutlineEntry
+from subsummarizer import predict_summaries
+
+STREAM_ROOT = Path("stream")
+
+def document_record(pdf_path, cache=None, analyze=main.analyze_document):
+    """Analyzes one PDF into its stream record.
+
+    The record keeps only what the merge needs: every heading with its BM25 body,
+    and the summarizer paragraph of each page that has a heading. Page texts are
+    dropped here, in the worker, so they never pile up in the parent process.
+    It also stores the PDF's content hash and the heading models' version, so
+    a resumed run can tell whether the record is still current.
+    """
+    result = analyze(pdf_path, cache)
+    outline, pages = result[:2]
+    sections = []
+    paragraphs = {}
+    for heading, body in zip(outline, section_bodies(outline, pages)):
+        sections.append([heading.level, heading.text, heading.page, body])
+        if str(heading.page) not in paragraphs:
+            try:
+                paragraphs[str(heading.page)] = main.section_paragraph(pages, heading.page)
+            except Exception:
+                paragraphs[str(heading.page)] = ""
+    record = {"document": Path(pdf_path).name, "digest": file_digest(pdf_path),
+              "models": model_version(main.MODEL_DIR), "sections": sections, "paragraphs": paragraphs}
+    if len(result) > 2:
+        record["performance"] = result[2]
+    return record
+
+class RecordStream:
+    """Append-only JSON Lines file of finished document records for one case.
+
+    Each record is flushed and fsynced as soon as its document is done, so a
+    crashed run loses at most the document in flight.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def finished(self):
+        """{document name: (digest, models)} of its last record. Drops a torn last line left by a crash."""
+        if not self.path.exists():
+            return {}
+        done = {}
+        good = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                    done[record["document"]] = (record.get("digest"), record.get("models"))
+                except (ValueError, KeyError):
+                    break
+                good += len(line)
+        if good < self.path.stat().st_size:
+            with open(self.path, "r+b") as f:
+                f.truncate(good)
+        return done
+
+    def append(self, record):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def offsets(self):
+        """{document name: byte offset of its record}; a later record for a name wins."""
+        offsets = {}
+        pos = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                offsets[json.loads(line)["document"]] = pos
+                pos += len(line)
+        return offsets
+
+    def records(self, names, offsets):
+        """Yields (name, record) for each of `names`, reading one record at a time."""
+        with open(self.path, "rb") as f:
+            for name in names:
+                f.seek(offsets[name])
+                yield name, json.loads(f.readline())
+
+def iter_records(pdf_paths, cache=None, analyze=main.analyze_document, pool=None, window=4):
+    """Yields document records in input order, keeping at most `window` documents in flight."""
+    if pool is None:
+        for pdf_path in pdf_paths:
+            yield document_record(pdf_path, cache, analyze)
+        return
+
+    pending = deque()
+    for pdf_path in pdf_paths:
+        pending.append(pool.submit(document_record, pdf_path, cache, analyze))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def merge_case(stream, persona, job, input_documents, timings=NULL_TIMINGS):
+    """Ranks and summarizes a case from its record stream into the output JSON.
+
+    The stream is read twice, one record at a time, in input order. The first
+    pass collects the collection-wide BM25 statistics. The second scores each
+    document's sections against them and keeps only those the ranking can
+    pick from it (at most MAX_SECTIONS_PER_DOCUMENT), with their paragraphs.
+    Memory holds the vocabulary, one length per section and the kept
+    sections, not every section body. The output is the same as
+    build_case_output over the in-memory analyses. Returns the output JSON
+    and the performance blocks found in the records.
+    """
+    offsets = stream.offsets()
+    missing = [name for name in input_documents if name not in offsets]
+    if missing:
+        raise ValueError(f"no stream record for: {', '.join(missing)}")
+
+    query = persona + " " + job
+    stats = SectionStats()
+    documents = []
+    with timings.stage("ranking"):
+        for name, record in stream.records(input_documents, offsets):
+            for level, text, page, body in record["sections"]:
+                stats.add(text, body)
+            if "performance" in record:
+                documents.append(record["performance"])
+
+        # A document's picks depend only on its own sections, so select per
+        # document and order the picks by score, then collection position.
+        candidates = []
+        first = 0
+        for name, record in stream.records(input_documents, offsets):
+            sections = record["sections"]
+            scores = stats.score([(text, body) for _, text, _, body in sections], query)
+            entries = [(name, OutlineEntry(level, text, page), scores[i], first + i,
+                        record["paragraphs"].get(str(page), ""))
+                       for i, (level, text, page, _) in enumerate(sections)]
+            candidates.extend(main.select_sections(entries, scores))
+            first += len(sections)
+        selected = sorted(candidates, key=lambda entry: (-entry[2], entry[3]))
+    paragraphs = [entry[4] for entry in selected]
+
+    with timings.stage("summarization"):
+        summaries = predict_summaries(paragraphs)
+    timings.count("sections", len(selected))
+    return main.case_output(persona, job, input_documents, selected, summaries), documents
+
+def stream_cases(stream_root=STREAM_ROOT, workers=1, cache=None, instrument=None, window=None):
+    """Runs every challenge case through the record stream and writes its output JSON.
+
+    Documents whose last record under `stream_root` was built from the same
+    PDF content and heading models are skipped, so rerunning after a crash
+    resumes at the first unfinished document. A replaced PDF or retrained
+    model gets a fresh record, which supersedes the old one. Returns the
+    names of the output files written.
+    """
+    main.OUTPUT_ROOT.mkdir(exist_ok=True)
+    analyze = main.document_analyzer(instrument)
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=main.load_models) if workers > 1 else None
+    window = window or 2 * workers
+    written = []
+    try:
+        for case_dir, persona, job, pdf_paths in main.find_cases():
+            stream = RecordStream(Path(stream_root) / f"{case_dir.name}.jsonl")
+            done = stream.finished()
+            version = model_version(main.MODEL_DIR)
+            todo = [p for p in pdf_paths if done.get(p.name) != (file_digest(p), version)]
+            for record in iter_records(todo, cache, analyze, pool, window):
+                stream.append(record)
+
+            input_documents = [p.name for p in pdf_paths]
+            if instrument is None:
+                out_json, _ = merge_case(stream, persona, job, input_documents)
+            else:
+                timings = Timings()
+                out_json, documents = merge_case(stream, persona, job, input_documents, timings)
+                out_json["metadata"]["performance"] = instrument.add_case(case_dir.name, documents, timings)
+            main.write_output(case_dir, out_json)
+            written.append(f"{case_dir.name}.json")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resumable, memory-bounded variant of main.py.")
+    parser.add_argument("--stream-dir", default=str(STREAM_ROOT),
+                        help="Directory for the per-case JSON Lines record streams (default stream/).")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", "1")))
+    parser.add_argument("--window", type=int, help="Documents in flight with --workers (default 2 per worker).")
+    parser.add_argument("--cache-dir", default=os.environ.get("OUTLINE_CACHE_DIR"),
+                        help="Directory for the persistent outline/page-text cache (disabled if unset).")
+    parser.add_argument("--cache-max-mb", type=int, default=512)
+    parser.add_argument("--timings", action="store_true", help="Add a metadata.performance block to every output.")
+    parser.add_argument("--prometheus", help="Also export the timings to this Prometheus text file (implies --timings).")
+    args = parser.parse_args()
+
+    cache = OutlineCache(args.cache_dir, args.cache_max_mb * 1024 * 1024, main.MODEL_DIR) if args.cache_dir else None
+    instrument = Instrumentation() if args.timings or args.prometheus else None
+    stream_cases(args.stream_dir, args.workers or os.cpu_count(), cache, instrument, args.window)
+    if args.prometheus:
+        write_prometheus(args.prometheus, instrument.cases)
@@ -1,15 +1,66 @@
-import joblib
-from sklearn.metrics.pairwise import cosine_similarity
+import os
+from flat_model import flat_path, is_current, load_summarizer
+from summary_index import index_path
 
-model = joblib.load("sub_summarizer_retrained.joblib")
-vectorizer = model["vectorizer"]
-matrix = model["matrix"]
-summaries = model["summaries"]
+# Which trained summarizer to serve; set SUBSUMMARIZER_MODEL or call load_model/use_model.
+MODEL_PATH = os.environ.get("SUBSUMMARIZER_MODEL", "sub_summarizer_retrained.joblib")
+
+vectorizer = None
+matrix = None
+summaries = None
+index = None
+
+def use_model(model, model_index=None):
+    """Serves summaries from an in-memory model dict (and optional SummaryIndex)."""
+    global vectorizer, matrix, summaries, index
+    vectorizer = model["vectorizer"]
+    matrix = model["matrix"]
+    summaries = model["summaries"]
+    index = model_index
+
+def load_model(path=None):
+    """Loads a saved model, plus the index saved next to it if there is one.
+
+    A current flat export of the model is memory-mapped instead of unpickled.
+    """
+    path = path or MODEL_PATH
+    if is_current(flat_path(path), path, index_path(path)):
+        use_model(*load_summarizer(flat_path(path)))
+        return
+    import joblib
+    model_index = joblib.load(index_path(path)) if os.path.exists(index_path(path)) else None
+    use_model(joblib.load(path), model_index)
 
 def predict_summary(paragraph: str) -> str:
     if not paragraph.strip():
         return ""
+    if vectorizer is None:
+        load_model()
     vec = vectorizer.transform([paragraph])
+    if index is not None:
+        return summaries[index.search(vec)]
+    from sklearn.metrics.pairwise import cosine_similarity
     sim = cosine_similarity(vec, matrix)
     best_idx = sim.argmax()
     return summaries[best_idx]
+
+def predict_summaries(paragraphs):
+    """Summarizes many paragraphs with one vectorizer call and one sparse product.
+
+    Gives the same result as calling `predict_summary` on each paragraph.
+    """
+    results = [""] * len(paragraphs)
+    todo = [i for i, p in enumerate(paragraphs) if p.strip()]
+    if not todo:
+        return results
+    if vectorizer is None:
+        load_model()
+    vecs = vectorizer.transform([paragraphs[i] for i in todo])
+    if index is not None:
+        best = [top[0] for top in index.search_batch(vecs)]
+    else:
+        from sklearn.metrics.pairwise import cosine_similarity
+        best = cosine_similarity(vecs, matrix).argmax(axis=1)
+    for i, best_idx in zip(todo, best):
+        results[i] = summaries[best_idx]
+    return results
@@ -0,0 +1,178 @@
+# summary_index.py
+
+from pathlib import Path
+import numpy as np
+from scipy.sparse import csr_matrix, hstack
+
+# Query terms kept per lookup, by TF-IDF weight. None scores every query term,
+# which matches the brute-force scan exactly; a cap is faster but approximate.
+MAX_QUERY_TERMS = None
+
+def index_path(model_path):
+    """Where the retrieval index for a summarizer model lives: next to the model."""
+    model_path = str(model_path)
+    stem = model_path[:-len(".joblib")] if model_path.endswith(".joblib") else model_path
+    return stem + ".index.joblib"
+
+def normalize_rows(matrix, norm="l2"):
+    """Scales each row of a sparse matrix to unit l2 (or l1) norm, like sklearn's `normalize`.
+
+    Rows are summed left to right as sklearn does, so the result is bit-identical.
+    All-zero rows are left as they are.
+    """
+    if norm not in ("l1", "l2"):
+        from sklearn.preprocessing import normalize
+        return normalize(matrix, norm=norm)
+    matrix = csr_matrix(matrix, dtype=np.float64, copy=True)
+    values = matrix.data * matrix.data if norm == "l2" else np.abs(matrix.data)
+    indptr = matrix.indptr.tolist()
+    norms = np.ones(matrix.shape[0])
+    for i, (start, end) in enumerate(zip(indptr[:-1], indptr[1:])):
+        if end > start:
+            total = np.add.accumulate(values[start:end])[-1]
+            if total != 0.0:
+                norms[i] = np.sqrt(total) if norm == "l2" else total
+    matrix.data /= np.repeat(norms, np.diff(matrix.indptr))
+    return matrix
+
+class SummaryIndex:
+    """Inverted postings over the L2-normalized rows of the summarizer matrix.
+
+    A lookup is one sparse product of the query with the term -> row postings,
+    so the stored matrix is normalized once at build time instead of on every
+    call. It is not sublinear: common char n-grams have postings nearly as
+    long as the corpus. With `max_query_terms`, queries are pruned to their
+    heaviest terms, which is faster but can pick another row than the exact
+    scan (see build_index). Single and batched lookups share one code path.
+    Incremental retraining appends rows as extra segments, merged by `compact`.
+    Ties and empty matches resolve to the lowest row, like
+    `cosine_similarity(...).argmax()` does.
+    """
+
+    def __init__(self, matrix, max_query_terms=MAX_QUERY_TERMS):
+        self.n_rows = matrix.shape[0]
+        self.postings = normalize_rows(matrix).T.tocsr()
+        self.max_query_terms = max_query_terms
+        self.segments = []
+
+    @classmethod
+    def from_postings(cls, postings, n_rows, max_query_terms=MAX_QUERY_TERMS):
+        """Wraps already-built postings (e.g. memory-mapped from a flat export) without copying."""
+        index = cls.__new__(cls)
+        index.n_rows = n_rows
+        index.postings = postings
+        index.max_query_terms = max_query_terms
+        index.segments = []
+        return index
+
+    def append(self, matrix):
+        """Indexes new rows as an extra postings segment, without touching existing ones."""
+        self.segments.append(normalize_rows(matrix).T.tocsr())
+        self.n_rows += matrix.shape[0]
+
+    def compact(self):
+        """Merges appended segments back into the main postings."""
+        if self.segments:
+            self.postings = hstack([self.postings] + self.segments, format="csr")
+            self.segments = []
+
+    def search(self, vec):
+        """Returns the best-matching row for a 1 x n_terms query vector."""
+        return int(self.search_batch(vec)[0][0])
+
+    def search_batch(self, vecs, k=1):
+        """Returns the top-k rows for every query row of an n x n_terms matrix.
+
+        All queries are scored with a single sparse matrix-matrix product
+        against the postings, after pruning them to their heaviest terms when
+        `max_query_terms` is set.
+        """
+        vecs = normalize_rows(vecs)
+        if self.max_query_terms is not None:
+            vecs = self._prune(vecs)
+        sims = vecs @ self.postings
+        segments = getattr(self, "segments", [])
+        if segments:
+            sims = hstack([sims] + [vecs @ segment for segment in segments])
+        sims = sims.tocsr()
+
+        results = []
+        for i in range(sims.shape[0]):
+            rows = sims.indices[sims.indptr[i]:sims.indptr[i + 1]]
+            scores = sims.data[sims.indptr[i]:sims.indptr[i + 1]]
+            top = rows[np.lexsort((rows, -scores))][:k]
+            if len(top) < k:
+                # Rows that share no term score 0; argmax order fills them lowest first.
+                rest = np.setdiff1d(np.arange(min(self.n_rows, k + len(top))), top)
+                top = np.concatenate([top, rest[:k - len(top)]])
+            results.append(top.astype(np.int64))
+        return results
+
+    def _prune(self, vecs):
+        data, indices, indptr = [], [], [0]
+        for i in range(vecs.shape[0]):
+            row_idx = vecs.indices[vecs.indptr[i]:vecs.indptr[i + 1]]
+            row_data = vecs.data[vecs.indptr[i]:vecs.indptr[i + 1]]
+            if len(row_idx) > self.max_query_terms:
+                keep = np.argsort(-row_data, kind="stable")[:self.max_query_terms]
+                row_idx, row_data = row_idx[keep], row_data[keep]
+            indices.append(row_idx)
+            data.append(row_data)
+            indptr.append(indptr[-1] + len(row_idx))
+        return csr_matrix(
+            (np.concatenate(data) if data else [], np.concatenate(indices) if indices else [], indptr),
+            shape=vecs.shape,
+        )
+
+    def save(self, path):
+        import joblib
+        joblib.dump(self, path)
+
+def recall_at_1(index, vectorizer, matrix, paragraphs):
+    """Share of queries whose index hit equals the exact cosine-similarity argmax."""
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    if not paragraphs:
+        return 1.0
+    vecs = vectorizer.transform(paragraphs)
+    exact = cosine_similarity(vecs, matrix).argmax(axis=1)
+    hits = sum(int(top[0] == best) for top, best in zip(index.search_batch(vecs), exact))
+    return hits / len(paragraphs)
+
+def page_paragraphs(pdf_dir="input", exclude=(), max_lines=8):
+    """First lines of every page of the PDFs under `pdf_dir`, as main.py builds summarizer queries.
+
+    Paragraphs in `exclude` (the training paragraphs) are left out, so these
+    are held-out queries.
+    """
+    from doc_store import DocumentStore
+
+    exclude = set(exclude)
+    paragraphs = []
+    store = DocumentStore()
+    try:
+        for pdf_path in sorted(Path(pdf_dir).glob("**/*.pdf")):
+            for page_number in range(len(store.open(pdf_path))):
+                paragraph = " ".join(store.first_lines(pdf_path, page_number, max_lines)).strip()
+                if paragraph and paragraph not in exclude:
+                    paragraphs.append(paragraph)
+    finally:
+        store.close()
+    return paragraphs
+
+def build_index(model, model_path, max_query_terms=MAX_QUERY_TERMS, pdf_dir="input"):
+    """Builds and saves the retrieval index for a summarizer model dict.
+
+    With `max_query_terms`, the index is approximate: its recall@1 against the
+    exact scan is measured on held-out input-page paragraphs and printed.
+    """
+    index = SummaryIndex(model["matrix"], max_query_terms)
+    index.save(index_path(model_path))
+    if max_query_terms is None:
+        print(f"Summary index: {index.n_rows} rows, exact search")
+        return index
+    queries = page_paragraphs(pdf_dir, model["paragraphs"])
+    recall = recall_at_1(index, model["vectorizer"], model["matrix"], queries)
+    print(f"Summary index: {index.n_rows} rows, max_query_terms={max_query_terms}, "
+          f"recall@1 vs exact search on {len(queries)} held-out page paragraphs = {recall:.3f}")
+    return index
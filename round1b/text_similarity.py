@@ -0,0 +1,68 @@
+import zlib
+from collections import Counter
+from difflib import SequenceMatcher
+
+import numpy as np
+
+MINHASH_PERMUTATIONS = 64
+SHINGLE_SIZE = 5
+_PRIME = (1 << 61) - 1
+_rng = np.random.RandomState(1234)
+_A = _rng.randint(1, 1 << 31, size=MINHASH_PERMUTATIONS).astype(np.uint64)
+_B = _rng.randint(0, 1 << 31, size=MINHASH_PERMUTATIONS).astype(np.uint64)
+
+def minhash_signature(text):
+    """MinHash signature of the character shingles of a (lowercased) text."""
+    shingles = {text[i:i + SHINGLE_SIZE] for i in range(max(len(text) - SHINGLE_SIZE + 1, 1))}
+    hashes = np.array([zlib.crc32(s.encode("utf-8")) for s in shingles], dtype=np.uint64)
+    return ((np.outer(hashes, _A) + _B) % _PRIME).min(axis=0)
+
+class TextMatcher:
+    """Finds the candidate text with the highest SequenceMatcher ratio to a query.
+
+    Candidates are visited from the highest cheap upper bound down. The length
+    bound 2*min(len)/(len_a+len_b) and the character-multiset bound used by
+    `quick_ratio` can never be below the true ratio, so candidates they rule
+    out are skipped without changing the result. The exact ratio only runs on
+    the survivors. With `minhash_threshold`, candidates whose estimated shingle
+    Jaccard falls below it are also skipped. That filter is approximate and can
+    drop true matches.
+    """
+
+    def __init__(self, candidates, threshold=0.85, minhash_threshold=None):
+        self.threshold = threshold
+        self.minhash_threshold = minhash_threshold
+        self.texts = [c.lower() for c in candidates]
+        self.lengths = np.array([len(t) for t in self.texts], dtype=np.float64)
+        self.counters = [Counter(t) for t in self.texts]
+        self.signatures = [minhash_signature(t) for t in self.texts] if minhash_threshold is not None else None
+
+    def best_match(self, text):
+        """Returns (candidate index, ratio) of the best match at or above threshold, or None."""
+        if not self.texts:
+            return None
+        query = text.lower()
+        total = self.lengths + len(query)
+        bounds = np.where(total > 0, 2.0 * np.minimum(self.lengths, len(query)) / np.maximum(total, 1), 1.0)
+        query_counter = None
+        query_signature = None
+
+        best, best_score = None, self.threshold
+        for i in np.argsort(-bounds, kind="stable"):
+            if bounds[i] < best_score:
+                break
+            if query_counter is None:
+                query_counter = Counter(query)
+            matches = sum((query_counter & self.counters[i]).values())
+            if total[i] and 2.0 * matches / total[i] < best_score:
+                continue
+            if self.signatures is not None:
+                if query_signature is None:
+                    query_signature = minhash_signature(query)
+                if (query_signature == self.signatures[i]).mean() < self.minhash_threshold:
+                    continue
+
+            score = SequenceMatcher(None, query, self.texts[i]).ratio()
+            if score > best_score or (score == best_score and (best is None or i < best)):
+                best, best_score = int(i), score
+        return (best, best_score) if best is not None else None
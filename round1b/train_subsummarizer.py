@@ -1,28 +1,41 @@
 # train_subsummarizer.py (overfit version)
 
+import argparse
 import pandas as pd
 import joblib
 from sklearn.feature_extraction.text import TfidfVectorizer
-
-df = pd.read_csv("subsection_training.csv")
-
-paragraphs = df["paragraph"].astype(str).str.strip().tolist()
-summaries = df["refined_text"].astype(str).str.strip().tolist()
-
-vectorizer = TfidfVectorizer(
-    analyzer="char_wb",        
-    ngram_range=(3, 5),        
-    max_features=None          
-)
-
-X = vectorizer.fit_transform(paragraphs)
-
-model = {
-    "vectorizer": vectorizer,
-    "paragraphs": paragraphs,
-    "summaries": summaries,
-    "matrix": X
-}
-
-joblib.dump(model, "sub_summarizer.joblib")
-
+from flat_model import save_summarizer
+from summary_index import MAX_QUERY_TERMS, build_index
+
+MODEL_PATH = "sub_summarizer.joblib"
+
+def train_base(df):
+    """Fits the char n-gram summarizer on a DataFrame of paragraph/refined_text pairs."""
+    paragraphs = df["paragraph"].astype(str).str.strip().tolist()
+    summaries = df["refined_text"].astype(str).str.strip().tolist()
+
+    vectorizer = TfidfVectorizer(
+        analyzer="char_wb",
+        ngram_range=(3, 5),
+        max_features=None
+    )
+
+    X = vectorizer.fit_transform(paragraphs)
+
+    return {
+        "vectorizer": vectorizer,
+        "paragraphs": paragraphs,
+        "summaries": summaries,
+        "matrix": X
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the base summarizer on subsection_training.csv.")
+    parser.add_argument("--max-query-terms", type=int, default=MAX_QUERY_TERMS,
+                        help="Prune index queries to their N heaviest terms: faster but approximate; prints "
+                             "the recall@1 against exact search (default: exact search).")
+    args = parser.parse_args()
+
+    model = train_base(pd.read_csv("subsection_training.csv"))
+    joblib.dump(model, MODEL_PATH)
+    save_summarizer(model, MODEL_PATH, build_index(model, MODEL_PATH, args.max_query_terms))